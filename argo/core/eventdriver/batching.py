@@ -0,0 +1,143 @@
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Union
+
+
+class Batcher:
+    """
+    Collects events for one subscriber and hands them over as a list once
+    ``batch_size`` events are buffered or ``max_latency_ms`` has passed since
+    the first one, whichever comes first.
+
+    With ``coalesce_key`` only the latest event per key is kept in the
+    buffer, so a burst of updates to the same item is delivered once.
+
+    The latency timer runs on the event loop when events arrive from a
+    coroutine and on a ``threading.Timer`` otherwise; in the latter case the
+    batch is delivered on the timer thread, unless ``on_loop`` says
+    ``deliver`` needs an event loop (async and queued subscribers): then
+    it is handed to the loop the events last came from, while that loop
+    still runs.
+    """
+
+    def __init__(self, deliver: Callable[[List[Any]], Any], batch_size: Optional[int] = None,
+                 max_latency_ms: Optional[float] = None, coalesce_key: Optional[Callable[[Any], Any]] = None,
+                 on_loop: bool = False):
+        if batch_size is None and max_latency_ms is None:
+            raise ValueError("a batching subscriber needs batch_size, max_latency_ms or both")
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError("batch_size must be positive")
+        if max_latency_ms is not None and max_latency_ms < 0:
+            raise ValueError("max_latency_ms can not be negative")
+        self.batch_size = batch_size
+        self.max_latency = None if max_latency_ms is None else max_latency_ms / 1000
+        self.coalesce_key = coalesce_key
+        self.coalesced = 0
+        self._deliver = deliver
+        self._buffer: Union[List[Any], Dict[Any, Any]] = {} if coalesce_key else []
+        self._timer: Optional[Union[asyncio.TimerHandle, threading.Timer]] = None
+        # the loop a TimerHandle belongs to
+        self._timer_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.on_loop = on_loop
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def add(self, event: Any):
+        self.add_many((event,))
+
+    def add_many(self, events: Iterable[Any]):
+        ready: List[List[Any]] = []
+        if self.on_loop:
+            loop = _running_loop()
+            if loop is not None:
+                self._loop = loop
+        with self._lock:
+            for event in events:
+                if self.coalesce_key is None:
+                    self._buffer.append(event)
+                else:
+                    key = self.coalesce_key(event)
+                    # re-insert so the surviving event sits at its latest position
+                    if self._buffer.pop(key, _MISSING) is not _MISSING:
+                        self.coalesced += 1
+                    self._buffer[key] = event
+                if self.batch_size is not None and len(self._buffer) >= self.batch_size:
+                    ready.append(self._take())
+            if self._buffer and self.max_latency is not None and not self._timer_pending():
+                self._arm()
+        for batch in ready:
+            self._deliver(batch)
+
+    def flush(self):
+        with self._lock:
+            batch = self._take() if self._buffer else None
+        if batch:
+            self._deliver(batch)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._cancel_timer()
+
+    def _take(self) -> List[Any]:
+        buffer = self._buffer
+        if self.coalesce_key is None:
+            self._buffer = []
+            batch = buffer
+        else:
+            self._buffer = {}
+            batch = list(buffer.values())
+        self._cancel_timer()
+        return batch
+
+    def _arm(self):
+        loop = _running_loop()
+        if loop is None:
+            timer = threading.Timer(self.max_latency, self._flush_from_thread if self.on_loop else self.flush)
+            timer.daemon = True
+            timer.start()
+            self._timer = timer
+        else:
+            self._timer = loop.call_later(self.max_latency, self.flush)
+            self._timer_loop = loop
+
+    def _timer_pending(self) -> bool:
+        # a handle on a loop that stopped or closed (e.g. a finished
+        # asyncio.run) will never fire, so it must not keep a new timer off
+        if self._timer is None:
+            return False
+        loop = self._timer_loop
+        if loop is None or (loop.is_running() and not loop.is_closed()):
+            return True
+        self._cancel_timer()
+        return False
+
+    def _flush_from_thread(self):
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            try:
+                loop.call_soon_threadsafe(self.flush)
+                return
+            except RuntimeError:
+                # closed in the meantime
+                pass
+        self.flush()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+            self._timer_loop = None
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+_MISSING = object()
@@ -0,0 +1,163 @@
+"""
+Compact tagged binary encoding for events crossing process boundaries.
+
+Scalars, str/bytes/bytearray, lists, tuples and dicts are written with a
+one-byte tag and varint lengths; anything else falls back to pickle under
+its own tag, so every picklable event can still be sent. A memoryview,
+which pickle refuses, is sent as its bytes and comes back as ``bytes``.
+"""
+import pickle
+import struct
+from typing import Any, Tuple
+
+_NONE = 0x00
+_FALSE = 0x01
+_TRUE = 0x02
+_INT = 0x03
+_FLOAT = 0x04
+_STR = 0x05
+_BYTES = 0x06
+_LIST = 0x07
+_TUPLE = 0x08
+_DICT = 0x09
+_PICKLE = 0x0A
+_BIGINT = 0x0B
+_BYTEARRAY = 0x0C
+
+_DOUBLE = struct.Struct("<d")
+
+
+def encode(obj: Any) -> bytes:
+    out = bytearray()
+    _encode(obj, out)
+    return bytes(out)
+
+
+def decode(data: bytes) -> Any:
+    view = memoryview(data)
+    try:
+        value, position = _decode(view, 0)
+    except (IndexError, struct.error):
+        raise ValueError("encoded value is truncated") from None
+    if position != len(view):
+        raise ValueError(f"{len(view) - position} trailing bytes after encoded value")
+    return value
+
+
+def _write_varint(value: int, out: bytearray):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(view: memoryview, position: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = view[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def _encode(obj: Any, out: bytearray):
+    # exact type checks: subclasses (enums, named tuples, ...) go through pickle
+    # so they come back as themselves
+    kind = type(obj)
+    if obj is None:
+        out.append(_NONE)
+    elif kind is bool:
+        out.append(_TRUE if obj else _FALSE)
+    elif kind is int:
+        if -(1 << 63) <= obj < (1 << 63):
+            out.append(_INT)
+            # zigzag keeps small negative numbers short
+            _write_varint((obj << 1) ^ (obj >> 63), out)
+        else:
+            data = obj.to_bytes((obj.bit_length() + 8) // 8, "little", signed=True)
+            out.append(_BIGINT)
+            _write_varint(len(data), out)
+            out += data
+    elif kind is float:
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(obj)
+    elif kind is str:
+        data = obj.encode("utf-8")
+        out.append(_STR)
+        _write_varint(len(data), out)
+        out += data
+    elif kind is bytes or kind is bytearray:
+        out.append(_BYTES if kind is bytes else _BYTEARRAY)
+        _write_varint(len(obj), out)
+        out += obj
+    elif kind is memoryview:
+        # len() counts items, not bytes, for formats wider than 'B'
+        data = obj.tobytes()
+        out.append(_BYTES)
+        _write_varint(len(data), out)
+        out += data
+    elif kind is list or kind is tuple:
+        out.append(_LIST if kind is list else _TUPLE)
+        _write_varint(len(obj), out)
+        for item in obj:
+            _encode(item, out)
+    elif kind is dict:
+        out.append(_DICT)
+        _write_varint(len(obj), out)
+        for key, value in obj.items():
+            _encode(key, out)
+            _encode(value, out)
+    else:
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        out.append(_PICKLE)
+        _write_varint(len(data), out)
+        out += data
+
+
+def _decode(view: memoryview, position: int) -> Tuple[Any, int]:
+    tag = view[position]
+    position += 1
+    if tag == _NONE:
+        return None, position
+    if tag == _FALSE:
+        return False, position
+    if tag == _TRUE:
+        return True, position
+    if tag == _INT:
+        raw, position = _read_varint(view, position)
+        return (raw >> 1) ^ -(raw & 1), position
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(view, position)[0], position + _DOUBLE.size
+    if tag in (_STR, _BYTES, _BYTEARRAY, _PICKLE, _BIGINT):
+        length, position = _read_varint(view, position)
+        end = position + length
+        if end > len(view):
+            raise ValueError("encoded value is truncated")
+        chunk = view[position:end]
+        if tag == _STR:
+            return str(chunk, "utf-8"), end
+        if tag == _BYTES:
+            return chunk.tobytes(), end
+        if tag == _BYTEARRAY:
+            return bytearray(chunk), end
+        if tag == _BIGINT:
+            return int.from_bytes(chunk, "little", signed=True), end
+        return pickle.loads(chunk), end
+    if tag == _LIST or tag == _TUPLE:
+        length, position = _read_varint(view, position)
+        items = []
+        for _ in range(length):
+            item, position = _decode(view, position)
+            items.append(item)
+        return (items if tag == _LIST else tuple(items)), position
+    if tag == _DICT:
+        length, position = _read_varint(view, position)
+        result = {}
+        for _ in range(length):
+            key, position = _decode(view, position)
+            result[key], position = _decode(view, position)
+        return result, position
+    raise ValueError(f"unknown tag 0x{tag:02x} at {position - 1}")
@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import inspect
+from enum import Enum
+from typing import Any, Callable, List, Optional
+
+from argo.utils.logger import logger
+
+
+class OverflowPolicy(str, Enum):
+    # what a non-blocking publish does when a subscriber's queue is full;
+    # publish_async always waits for room instead
+    DROP_NEW = "drop_new"
+    DROP_OLDEST = "drop_oldest"
+    RAISE = "raise"
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class QueuedDispatcher:
+    """
+    Feeds one subscriber through bounded ``asyncio.Queue`` s drained by a fixed
+    number of worker coroutines.
+
+    Without ``key`` all workers share one queue. With ``key`` every worker owns
+    a queue and events are sharded by ``hash(key(event))``, so events sharing a
+    key are handled one at a time, in publish order.
+
+    Each event carries the context it was published in, so contextvars
+    such as the current span or journal offset are those of its publisher,
+    not of whichever publish happened to start the workers.
+    """
+
+    def __init__(self, callback: Callable[[Any], Any], maxsize: int = 1024, workers: int = 1,
+                 key: Optional[Callable[[Any], Any]] = None,
+                 overflow: OverflowPolicy = OverflowPolicy.DROP_NEW, name: str = ""):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive, queued subscribers are always bounded")
+        if workers <= 0:
+            raise ValueError("workers must be positive")
+        self.callback = callback
+        self.is_async = inspect.iscoroutinefunction(callback)
+        self.maxsize = maxsize
+        self.workers = workers
+        self.key = key
+        self.overflow = OverflowPolicy(overflow)
+        self.name = name or getattr(callback, "__qualname__", repr(callback))
+        self.dropped = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def offer(self, event: Any) -> bool:
+        """Enqueue without waiting; returns False when the event (or an older one) was dropped."""
+        queue = self._queue_for(event)
+        item = (contextvars.copy_context(), event)
+        try:
+            queue.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.overflow is OverflowPolicy.RAISE:
+            raise QueueFullError(f"queue for subscriber {self.name} is full")
+        self.dropped += 1
+        if self.overflow is OverflowPolicy.DROP_OLDEST:
+            queue.get_nowait()
+            queue.task_done()
+            queue.put_nowait(item)
+        return False
+
+    async def put(self, event: Any):
+        await self._queue_for(event).put((contextvars.copy_context(), event))
+
+    async def drain(self):
+        for queue in list(self._queues):
+            await queue.join()
+
+    async def aclose(self):
+        self._closed = True
+        if self._loop is asyncio.get_running_loop():
+            await self.drain()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queues = []
+        self._loop = None
+
+    def _queue_for(self, event: Any) -> asyncio.Queue:
+        if self._closed:
+            raise RuntimeError(f"subscriber {self.name} is closed")
+        # raises RuntimeError outside a running loop, like asyncio.create_task
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._start(loop)
+        queues = self._queues
+        if len(queues) == 1:
+            return queues[0]
+        return queues[hash(self.key(event)) % len(queues)]
+
+    def _start(self, loop: asyncio.AbstractEventLoop):
+        # queues and workers belong to one loop; a new loop (e.g. a second
+        # asyncio.run) starts from scratch since the old workers are gone
+        self._loop = loop
+        if self.key is None:
+            queue = asyncio.Queue(self.maxsize)
+            self._queues = [queue]
+            self._workers = [loop.create_task(self._work(queue), context=contextvars.Context())
+                             for _ in range(self.workers)]
+        else:
+            self._queues = [asyncio.Queue(self.maxsize) for _ in range(self.workers)]
+            self._workers = [loop.create_task(self._work(queue), context=contextvars.Context())
+                             for queue in self._queues]
+
+    async def _work(self, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        while True:
+            context, event = await queue.get()
+            try:
+                if self.is_async:
+                    await loop.create_task(self.callback(event), context=context)
+                else:
+                    context.run(self.callback, event)
+            except Exception:
+                logger.exception("[Event] subscriber %s failed", self.name)
+            finally:
+                queue.task_done()
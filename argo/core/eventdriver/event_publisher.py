@@ -1,32 +1,561 @@
 import asyncio
 import inspect
-from typing import Callable, Dict, List, Any
+import itertools
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, Iterable, List, Optional, Set, Tuple, Union
 
+from argo.core.eventdriver.batching import Batcher
+from argo.core.eventdriver.dispatch_queue import OverflowPolicy, QueuedDispatcher, QueueFullError
+from argo.core.eventdriver.executors import ExecutorKind, ExecutorPools, OffloadedHandler
+from argo.core.eventdriver.journal import Journal, _current_offset
+from argo.core.eventdriver.metrics import EventBusMetrics, _published_topic
+from argo.core.eventdriver.topic_trie import TopicTrie
+from argo.core.eventdriver.transport import BROADCAST, Transport
 from argo.utils.logger import logger
 
+_EMPTY: Tuple = ()
+
+
+class Subscription:
+    """Handle returned by ``EventBus.subscribe``; ``unsubscribe()`` is O(1)."""
+
+    __slots__ = ("event_type", "callback", "handler", "is_async", "dispatcher", "offload", "batcher", "group",
+                 "_seq", "_bus", "__weakref__")
+
+    def __init__(self, bus: "EventBus", event_type: str, callback: Callable[[Any], Any], seq: int,
+                 dispatcher: Optional[QueuedDispatcher] = None, offload: Optional[OffloadedHandler] = None,
+                 group: Optional[str] = None):
+        self.event_type = event_type
+        self.callback = callback
+        # what the bus actually calls: the callback itself or its instrumented wrapper
+        self.handler = callback
+        self.is_async = inspect.iscoroutinefunction(callback)
+        self.dispatcher = dispatcher
+        self.offload = offload
+        self.batcher: Optional[Batcher] = None
+        self.group = group
+        self._seq = seq
+        self._bus = bus
+
+    @property
+    def active(self) -> bool:
+        return self._bus is not None
+
+    def unsubscribe(self):
+        if self._bus is not None:
+            self._bus._remove(self)
+
+    def __repr__(self):
+        return f"Subscription({self.event_type!r}, {self.callback!r})"
+
+
+# (sync callbacks, async callbacks, queued dispatchers, offloaded handlers,
+# batchers), built once per topic and reused by every publish
+Route = Tuple[
+    Tuple[Callable[[Any], Any], ...],
+    Tuple[Callable[[Any], Any], ...],
+    Tuple[QueuedDispatcher, ...],
+    Tuple[OffloadedHandler, ...],
+    Tuple[Batcher, ...],
+]
+
 
 class EventBus:
-    def __init__(self):
-        self._subscribers: Dict[str, List[Callable[[Any], None]]] = {}
-
-    def subscribe(self, event_type: str, callback: Callable[[Any], None]):
-        if event_type not in self._subscribers:
-            self._subscribers[event_type] = []
-        self._subscribers[event_type].append(callback)
-
-    def unsubscribe(self, event_type: str, callback: Callable[[Any], None]):
-        if event_type in self._subscribers:
-            self._subscribers[event_type].remove(callback)
-
-    def publish(self, event_type: str, event: Any):
-        for subscriber in self._subscribers.get(event_type, []):
-            if inspect.iscoroutinefunction(subscriber):
-                try:
-                    logger.info(f"[Event] publishing event {event_type}")
-                    asyncio.create_task(subscriber(event))
-                except RuntimeError as e:
-                    print(f"Error: can not handle event {event_type}. {e}")
-            else:
+    def __init__(self, route_cache_size: int = 4096, thread_workers: Optional[int] = None,
+                 process_workers: Optional[int] = None):
+        self._trie = TopicTrie()
+        # (event_type, callback) -> subscriptions, for unsubscribe by callback
+        self._by_callback: Dict[Tuple[str, Callable], Dict[Subscription, None]] = {}
+        # keyed by topic, or by (topic, groups) for events from the transport
+        self._routes: Dict[Union[str, Tuple[str, Tuple[str, ...]]], Route] = {}
+        self._route_cache_size = route_cache_size
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._dispatchers: Dict[QueuedDispatcher, None] = {}
+        # strong references keep fire-and-forget tasks from being collected mid-flight
+        self._tasks: Set[asyncio.Task] = set()
+        self.executors = ExecutorPools(thread_workers, process_workers)
+        self._futures: Set[Future] = set()
+        self._batchers: Dict[Batcher, None] = {}
+        # None keeps instrumentation off the publish path entirely
+        self.metrics: Optional[EventBusMetrics] = None
+        self.journal: Optional[Journal] = None
+        self._durable = False
+        self.transport: Optional[Transport] = None
+        self._transport_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, event_type: str, callback: Callable[[Any], None], *, queued: bool = False,
+                  maxsize: int = 1024, workers: int = 1, key: Optional[Callable[[Any], Any]] = None,
+                  overflow: Union[OverflowPolicy, str] = OverflowPolicy.DROP_NEW,
+                  executor: Union[ExecutorKind, str] = ExecutorKind.INLINE,
+                  max_concurrency: Optional[int] = None, batch_size: Optional[int] = None,
+                  max_latency_ms: Optional[float] = None,
+                  coalesce_key: Optional[Callable[[Any], Any]] = None,
+                  group: Optional[str] = None) -> Subscription:
+        """
+        With ``queued=True`` the callback is fed through a bounded queue of
+        ``maxsize`` drained by ``workers`` coroutines instead of one task per
+        event; ``key`` keeps events that share a key in order and ``overflow``
+        decides what ``publish``/``try_publish`` do when the queue is full.
+
+        ``executor="thread"`` or ``"process"`` runs a sync callback on the bus's
+        shared pools, at most ``max_concurrency`` calls at a time; ``publish``
+        then returns the futures of those calls.
+
+        ``batch_size`` and/or ``max_latency_ms`` make the callback receive
+        lists of events instead, delivered through whichever mode above it
+        uses; ``coalesce_key`` keeps only the latest event per key in a batch.
+
+        With a transport attached, a subscriber gets by default every
+        matching event published in any process. Subscribers that pass the
+        same ``group`` compete instead: each event goes to one process
+        among those subscribed with that group, so N worker processes split
+        the work. Without a transport ``group`` makes no difference.
+        """
+        if group == BROADCAST:
+            raise ValueError("group must be a non-empty name")
+        executor = ExecutorKind(executor)
+        dispatcher = None
+        offload = None
+        if queued:
+            if executor is not ExecutorKind.INLINE:
+                raise ValueError("a subscriber is either queued or offloaded to an executor, not both")
+            if key is not None and workers > 1 and getattr(callback, "journal", None) is not None:
+                # shards start events out of order, a durable checkpoint could skip one not yet started
+                raise ValueError("a durable subscriber can not be queued with a key and several workers")
+            dispatcher = QueuedDispatcher(callback, maxsize=maxsize, workers=workers, key=key,
+                                          overflow=overflow)
+        elif executor is not ExecutorKind.INLINE:
+            offload = OffloadedHandler(callback, self.executors, executor, max_concurrency, event_type)
+        subscription = Subscription(self, event_type, callback, next(self._seq), dispatcher, offload, group)
+        if batch_size is not None or max_latency_ms is not None or coalesce_key is not None:
+            # async and queued subscribers can only be fed on an event loop
+            on_loop = dispatcher is not None or (offload is None and subscription.is_async)
+            subscription.batcher = Batcher(self._batch_target(subscription), batch_size, max_latency_ms,
+                                           coalesce_key, on_loop)
+        with self._lock:
+            if self.metrics is not None:
+                self._instrument(subscription)
+            self._trie.add(event_type, subscription)
+            self._by_callback.setdefault((event_type, callback), {})[subscription] = None
+            if dispatcher is not None:
+                self._dispatchers[dispatcher] = None
+            if subscription.batcher is not None:
+                self._batchers[subscription.batcher] = None
+            self._invalidate()
+            transport = self.transport
+        if transport is not None:
+            transport.subscribe(event_type, group)
+        return subscription
+
+    def unsubscribe(self, event_type: Union[str, Subscription], callback: Optional[Callable[[Any], None]] = None):
+        if isinstance(event_type, Subscription):
+            event_type.unsubscribe()
+            return
+        subscriptions = self._by_callback.get((event_type, callback))
+        if subscriptions:
+            # mirrors list.remove: drops the earliest matching registration
+            self._remove(next(iter(subscriptions)))
+
+    def publish(self, event_type: str, event: Any) -> Tuple[Future, ...]:
+        """Returns the futures of offloaded subscribers, empty when there are none."""
+        return self._dispatch(event_type, event)[1]
+
+    def try_publish(self, event_type: str, event: Any) -> bool:
+        """Publish without waiting; False if a full queue shed an event per its overflow policy."""
+        return self._dispatch(event_type, event)[0]
+
+    async def publish_async(self, event_type: str, event: Any) -> List[asyncio.Future]:
+        """
+        Publish and wait for room in every queued subscriber's queue
+        (backpressure). Returns awaitables for the offloaded subscribers,
+        ready for ``asyncio.gather``.
+        """
+        journal = self.journal
+        if journal is not None:
+            offset = journal.append(event_type, event)
+            if self._durable:
+                await asyncio.get_running_loop().run_in_executor(None, journal.wait, offset)
+            if self.transport is not None:
+                self.transport.send(event_type, event)
+            token = _current_offset.set(offset)
+            try:
+                return await self._deliver_async(event_type, event)
+            finally:
+                _current_offset.reset(token)
+        if self.transport is not None:
+            self.transport.send(event_type, event)
+        return await self._deliver_async(event_type, event)
+
+    async def _deliver_async(self, event_type: str, event: Any) -> List[asyncio.Future]:
+        route = self._routes.get(event_type)
+        if route is None:
+            route = self._resolve(event_type)
+        sync_subscribers, async_subscribers, dispatchers, offloaded, batchers = route
+        token = None
+        if self.metrics is not None:
+            self.metrics.record_publish(event_type)
+            token = _published_topic.set(event_type)
+        try:
+            futures = self._offload(event, offloaded) if offloaded else _EMPTY
+            for subscriber in sync_subscribers:
                 subscriber(event)
+            if async_subscribers:
+                logger.info("[Event] publishing event %s", event_type)
+                self._spawn(event_type, event, async_subscribers)
+            for dispatcher in dispatchers:
+                await dispatcher.put(event)
+            for batcher in batchers:
+                batcher.add(event)
+        finally:
+            if token is not None:
+                _published_topic.reset(token)
+        return [asyncio.wrap_future(future) for future in futures]
+
+    def publish_many(self, event_type: str, events: Iterable[Any]) -> List[Future]:
+        """
+        Publish a burst of events of one type, resolving the route and
+        logging once for the whole burst. Each subscriber sees the events in
+        order, but gets all of them before the next subscriber starts;
+        batching subscribers take the burst in one go.
+        """
+        events = events if isinstance(events, (list, tuple)) else list(events)
+        if self.journal is not None or self.transport is not None:
+            # every event needs its own offset in the handlers' context and
+            # its own frame on the transport
+            futures: List[Future] = []
+            for event in events:
+                futures.extend(self._dispatch(event_type, event)[1])
+            return futures
+        route = self._routes.get(event_type)
+        if route is None:
+            route = self._resolve(event_type)
+        sync_subscribers, async_subscribers, dispatchers, offloaded, batchers = route
+        token = None
+        if self.metrics is not None:
+            self.metrics.record_publish(event_type, len(events))
+            token = _published_topic.set(event_type)
+        futures = []
+        try:
+            if offloaded:
+                for event in events:
+                    futures.extend(self._offload(event, offloaded))
+            for subscriber in sync_subscribers:
+                for event in events:
+                    subscriber(event)
+            if async_subscribers:
+                logger.info("[Event] publishing %d events %s", len(events), event_type)
+                for event in events:
+                    self._spawn(event_type, event, async_subscribers)
+            for dispatcher in dispatchers:
+                for event in events:
+                    self._offer(event_type, event, dispatcher)
+            for batcher in batchers:
+                batcher.add_many(events)
+        finally:
+            if token is not None:
+                _published_topic.reset(token)
+        return futures
+
+    def flush(self):
+        """Deliver whatever the batching subscribers have buffered so far."""
+        for batcher in list(self._batchers):
+            batcher.flush()
+
+    def attach_journal(self, journal: Journal, durable: bool = False):
+        """
+        Append every published event to ``journal`` before dispatching it.
+        With ``durable`` publish also waits until the event is committed;
+        concurrent publishers share fsyncs through the journal's group commit.
+        """
+        self.journal = journal
+        self._durable = durable
+
+    def detach_journal(self) -> Optional[Journal]:
+        journal, self.journal = self.journal, None
+        return journal
+
+    def attach_transport(self, transport: Transport, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Share this bus with the buses of other processes through ``transport``.
+        Every publish is also sent there, and events published elsewhere on
+        topics this bus subscribes to are dispatched here as if published
+        locally, though never sent on again or journaled; subscribers in a
+        ``group`` only get the events the broker picks this process for,
+        whether published here or elsewhere. Remote events arrive on
+        the transport's thread; with ``loop`` (by default the running one,
+        if any) they are handed over to that loop, which async and queued
+        subscribers need.
+        """
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        with self._lock:
+            if self.transport is not None:
+                raise RuntimeError("a transport is already attached")
+            self.transport = transport
+            self._transport_loop = loop
+            patterns = [(s.event_type, s.group) for s in self._subscriptions()]
+            self._invalidate()
+        transport.attach(self._receive)
+        for pattern, group in patterns:
+            transport.subscribe(pattern, group)
+
+    def detach_transport(self) -> Optional[Transport]:
+        with self._lock:
+            transport, self.transport = self.transport, None
+            patterns = [(s.event_type, s.group) for s in self._subscriptions()]
+            self._invalidate()
+        if transport is not None:
+            transport.attach(None)
+            for pattern, group in patterns:
+                transport.unsubscribe(pattern, group)
+        return transport
+
+    def _receive(self, event_type: str, event: Any, groups: Tuple[str, ...]):
+        loop = self._transport_loop
+        if loop is None:
+            self._deliver(event_type, event, groups)
+        else:
+            loop.call_soon_threadsafe(self._deliver, event_type, event, groups)
+
+    def replay(self, from_offset: int = 0, topic: Optional[str] = None) -> int:
+        """
+        Dispatch journaled events from ``from_offset`` on to the current
+        subscribers without journaling them again; returns how many were
+        replayed.
+        """
+        if self.journal is None:
+            raise RuntimeError("no journal attached")
+        count = 0
+        for offset, event_type, event in self.journal.replay(from_offset, topic):
+            token = _current_offset.set(offset)
+            try:
+                self._deliver(event_type, event)
+            finally:
+                _current_offset.reset(token)
+            count += 1
+        return count
+
+    def _dispatch(self, event_type: str, event: Any) -> Tuple[bool, Tuple[Future, ...]]:
+        journal = self.journal
+        if journal is None:
+            if self.transport is not None:
+                self.transport.send(event_type, event)
+            return self._deliver(event_type, event)
+        offset = journal.append(event_type, event)
+        if self._durable:
+            journal.wait(offset)
+        if self.transport is not None:
+            # only events that made it into the journal leave the process
+            self.transport.send(event_type, event)
+        token = _current_offset.set(offset)
+        try:
+            return self._deliver(event_type, event)
+        finally:
+            _current_offset.reset(token)
+
+    def _deliver(self, event_type: str, event: Any,
+                 groups: Optional[Tuple[str, ...]] = None) -> Tuple[bool, Tuple[Future, ...]]:
+        route = self._routes.get(event_type if groups is None else (event_type, groups))
+        if route is None:
+            route = self._resolve(event_type, groups)
+        sync_subscribers, async_subscribers, dispatchers, offloaded, batchers = route
+        token = None
+        if self.metrics is not None:
+            self.metrics.record_publish(event_type)
+            # spans report this topic rather than the subscriber's pattern
+            token = _published_topic.set(event_type)
+        try:
+            # hand work to the pools first so it overlaps with the inline subscribers
+            futures = self._offload(event, offloaded) if offloaded else _EMPTY
+            for subscriber in sync_subscribers:
+                subscriber(event)
+            if async_subscribers:
+                logger.info("[Event] publishing event %s", event_type)
+                self._spawn(event_type, event, async_subscribers)
+            accepted = True
+            for dispatcher in dispatchers:
+                if not self._offer(event_type, event, dispatcher):
+                    accepted = False
+            for batcher in batchers:
+                batcher.add(event)
+        finally:
+            if token is not None:
+                _published_topic.reset(token)
+        return accepted, futures
+
+    def _offer(self, event_type: str, event: Any, dispatcher: QueuedDispatcher) -> bool:
+        try:
+            return dispatcher.offer(event)
+        except QueueFullError:
+            raise
+        except RuntimeError as e:
+            logger.error("[Event] can not handle event %s: %s", event_type, e)
+            return False
+
+    def _offload(self, event: Any, offloaded: Tuple[OffloadedHandler, ...]) -> Tuple[Future, ...]:
+        futures = tuple(handler.submit(event) for handler in offloaded)
+        for future in futures:
+            self._futures.add(future)
+            future.add_done_callback(self._futures.discard)
+        metrics = self.metrics
+        if metrics is not None:
+            for handler, future in zip(offloaded, futures):
+                metrics.observe_future(handler, future)
+        return futures
+
+    async def drain(self):
+        """Wait until every buffered or queued event and every spawned handler task has finished."""
+        self.flush()
+        while True:
+            for dispatcher in list(self._dispatchers):
+                await dispatcher.drain()
+            if not self._tasks and not self._futures:
+                break
+            pending = list(self._tasks) + [asyncio.wrap_future(f) for f in list(self._futures)]
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    async def aclose(self):
+        await self.drain()
+        dispatchers = list(self._dispatchers)
+        self._dispatchers.clear()
+        for dispatcher in dispatchers:
+            await dispatcher.aclose()
+        await asyncio.get_running_loop().run_in_executor(None, self.executors.shutdown)
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks)
+
+    def enable_metrics(self, precision: int = 5, max_topics: int = 10000) -> EventBusMetrics:
+        """
+        Start counting publishes per topic and timing every subscriber call;
+        read the results with ``bus.metrics.snapshot()``. Until this is called
+        the publish path carries no instrumentation at all.
+        """
+        with self._lock:
+            if self.metrics is None:
+                self.metrics = EventBusMetrics(self, precision, max_topics)
+                for subscription in self._subscriptions():
+                    self._instrument(subscription)
+                self._invalidate()
+            return self.metrics
+
+    def disable_metrics(self):
+        with self._lock:
+            self.metrics = None
+            for subscription in self._subscriptions():
+                subscription.handler = subscription.callback
+                if subscription.dispatcher is not None:
+                    subscription.dispatcher.callback = subscription.callback
+            self._invalidate()
+
+    def _subscriptions(self):
+        for subscriptions in self._by_callback.values():
+            yield from subscriptions
+
+    def _instrument(self, subscription: Subscription):
+        if subscription.offload is not None:
+            # timed through its futures, see _offload
+            return
+        subscription.handler = self.metrics.instrument(subscription, subscription.callback, subscription.is_async)
+        if subscription.dispatcher is not None:
+            subscription.dispatcher.callback = subscription.handler
+
+    def _spawn(self, event_type: str, event: Any, async_subscribers: Tuple[Callable[[Any], Any], ...]):
+        for subscriber in async_subscribers:
+            coroutine = subscriber(event)
+            try:
+                task = asyncio.create_task(coroutine)
+            except RuntimeError as e:
+                coroutine.close()
+                print(f"Error: can not handle event {event_type}. {e}")
+                continue
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _remove(self, subscription: Subscription):
+        with self._lock:
+            if subscription._bus is None:
+                return
+            subscription._bus = None
+            self._trie.remove(subscription.event_type, subscription)
+            key = (subscription.event_type, subscription.callback)
+            subscriptions = self._by_callback.get(key)
+            if subscriptions is not None:
+                subscriptions.pop(subscription, None)
+                if not subscriptions:
+                    del self._by_callback[key]
+            self._invalidate()
+            dispatcher = subscription.dispatcher
+            batcher = subscription.batcher
+            if batcher is not None:
+                self._batchers.pop(batcher, None)
+            if self.metrics is not None:
+                self.metrics.forget(subscription)
+            transport = self.transport
+        if transport is not None:
+            transport.unsubscribe(subscription.event_type, subscription.group)
+        if batcher is not None:
+            # hand over what was buffered before the subscriber goes away
+            batcher.close()
+        if dispatcher is not None and dispatcher in self._dispatchers:
+            del self._dispatchers[dispatcher]
+            self._retire(dispatcher)
+
+    def _batch_target(self, subscription: Subscription) -> Callable[[List[Any]], Any]:
+        # batches travel the same way single events would for this subscriber
+        if subscription.dispatcher is not None:
+            dispatcher = subscription.dispatcher
+            return lambda batch: self._offer(subscription.event_type, batch, dispatcher)
+        if subscription.offload is not None:
+            offloaded = (subscription.offload,)
+            return lambda batch: self._offload(batch, offloaded)
+        if subscription.is_async:
+            return lambda batch: self._spawn(subscription.event_type, batch, (subscription.handler,))
+        return lambda batch: subscription.handler(batch)
+
+    def _retire(self, dispatcher: QueuedDispatcher):
+        # let already queued events finish, then stop the workers
+        try:
+            task = asyncio.get_running_loop().create_task(dispatcher.aclose())
+        except RuntimeError:
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _invalidate(self):
+        # swap rather than clear so a concurrent publish never sees a half-built dict
+        self._routes = {}
+
+    def _resolve(self, event_type: str, groups: Optional[Tuple[str, ...]] = None) -> Route:
+        # only reached on a cache miss; the lock keeps a stale route from being
+        # written into a cache that a concurrent subscribe just replaced
+        with self._lock:
+            subscriptions = sorted(self._trie.match(event_type), key=lambda s: s._seq)
+            if groups is not None:
+                # an event from the transport, for the groups the broker picked us for
+                subscriptions = [s for s in subscriptions if (s.group or BROADCAST) in groups]
+            elif self.transport is not None:
+                # grouped subscribers get local events back from the broker too
+                subscriptions = [s for s in subscriptions if s.group is None]
+            batchers = tuple(s.batcher for s in subscriptions if s.batcher is not None)
+            single = [s for s in subscriptions if s.batcher is None]
+            direct = [s for s in single if s.dispatcher is None and s.offload is None]
+            sync_subscribers = tuple(s.handler for s in direct if not s.is_async)
+            async_subscribers = tuple(s.handler for s in direct if s.is_async)
+            dispatchers = tuple(s.dispatcher for s in single if s.dispatcher is not None)
+            offloaded = tuple(s.offload for s in single if s.offload is not None)
+            route = (sync_subscribers or _EMPTY, async_subscribers or _EMPTY, dispatchers or _EMPTY,
+                     offloaded or _EMPTY, batchers or _EMPTY)
+            routes = self._routes
+            if len(routes) >= self._route_cache_size:
+                routes = self._routes = {}
+            routes[event_type if groups is None else (event_type, groups)] = route
+        return route
 
 event_bus = EventBus()
@@ -0,0 +1,137 @@
+import inspect
+import os
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Deque, Optional, Tuple
+
+from argo.utils.logger import logger
+
+
+class ExecutorKind(str, Enum):
+    INLINE = "inline"
+    THREAD = "thread"
+    # handler and events must be picklable
+    PROCESS = "process"
+
+
+class ExecutorPools:
+    """Thread and process pools shared by every offloaded subscriber of one bus, created on first use."""
+
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def configure(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        # takes effect for pools created after this call; running pools keep their size
+        with self._lock:
+            if thread_workers is not None:
+                self.thread_workers = thread_workers
+            if process_workers is not None:
+                self.process_workers = process_workers
+
+    def get(self, kind: ExecutorKind) -> Executor:
+        with self._lock:
+            if kind is ExecutorKind.THREAD:
+                if self._thread_pool is None:
+                    self._thread_pool = ThreadPoolExecutor(self.thread_workers,
+                                                           thread_name_prefix="argo-event")
+                return self._thread_pool
+            if kind is ExecutorKind.PROCESS:
+                if self._process_pool is None:
+                    self._process_pool = ProcessPoolExecutor(self.process_workers or os.cpu_count())
+                return self._process_pool
+        raise ValueError(f"no pool for executor kind {kind}")
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            pools = (self._thread_pool, self._process_pool)
+            self._thread_pool = None
+            self._process_pool = None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=wait)
+
+
+class OffloadedHandler:
+    """
+    Runs a sync subscriber on a shared pool. ``max_concurrency`` caps how many
+    of its calls are on the pool at once; the rest wait in a local backlog
+    instead of blocking the publisher.
+    """
+
+    def __init__(self, callback: Callable[[Any], Any], pools: ExecutorPools, kind: ExecutorKind,
+                 max_concurrency: Optional[int] = None, event_type: str = ""):
+        if inspect.iscoroutinefunction(callback):
+            raise ValueError("async subscribers already run on the event loop, only sync ones can be offloaded")
+        if max_concurrency is not None and max_concurrency <= 0:
+            raise ValueError("max_concurrency must be positive")
+        self.callback = callback
+        self.event_type = event_type
+        self.kind = kind
+        self.max_concurrency = max_concurrency
+        self.name = getattr(callback, "__qualname__", repr(callback))
+        self._pools = pools
+        self._running = 0
+        self._backlog: Deque[Tuple[Any, Future]] = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def backlog(self) -> int:
+        return len(self._backlog)
+
+    def submit(self, event: Any) -> Future:
+        if self.max_concurrency is None:
+            return self._run(event)
+        with self._lock:
+            if self._running >= self.max_concurrency:
+                future: Future = Future()
+                self._backlog.append((event, future))
+                return future
+            self._running += 1
+        return self._run(event)
+
+    def _run(self, event: Any, outer: Optional[Future] = None) -> Future:
+        try:
+            future = self._pools.get(self.kind).submit(self.callback, event)
+        except BaseException as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(self._done)
+        if outer is not None:
+            future.add_done_callback(lambda f: _copy_result(f, outer))
+        return future
+
+    def _done(self, future: Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("[Event] offloaded subscriber %s failed: %r", self.name, future.exception())
+        if self.max_concurrency is None:
+            return
+        with self._lock:
+            if not self._backlog:
+                self._running -= 1
+                return
+            event, outer = self._backlog.popleft()
+        # the freed slot goes straight to the next waiting event
+        if outer.set_running_or_notify_cancel():
+            self._run(event, outer)
+        else:
+            self._done(_CANCELLED)
+
+
+def _copy_result(source: Future, target: Future):
+    if source.cancelled():
+        # target is already running, so it can only carry the cancellation as an error
+        target.set_exception(CancelledError())
+    elif source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
+_CANCELLED: Future = Future()
+_CANCELLED.cancel()
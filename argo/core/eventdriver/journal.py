@@ -0,0 +1,586 @@
+import bisect
+import contextvars
+import glob
+import inspect
+import json
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set, Tuple
+
+from argo.core.eventdriver.topic_trie import TopicTrie
+from argo.utils.logger import logger
+
+# payload length, crc32, offset, topic length; the payload is the utf-8 topic
+# followed by the serialized event
+_HEADER = struct.Struct("<IIQH")
+_INDEX_ENTRY = struct.Struct("<QQ")
+_SEGMENT_SUFFIX = ".log"
+_INDEX_SUFFIX = ".idx"
+
+Record = Tuple[int, str, Any]
+
+_current_offset: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("argo_journal_offset",
+                                                                                  default=None)
+
+
+def current_offset() -> Optional[int]:
+    """Journal offset of the event being handled, when the bus has a journal attached."""
+    return _current_offset.get()
+
+
+class JournalCorruptError(RuntimeError):
+    pass
+
+
+class _Segment:
+    __slots__ = ("base", "path", "index_path", "size", "last_offset", "index")
+
+    def __init__(self, directory: str, base: int):
+        self.base = base
+        self.path = os.path.join(directory, f"{base:020d}{_SEGMENT_SUFFIX}")
+        self.index_path = os.path.join(directory, f"{base:020d}{_INDEX_SUFFIX}")
+        # bytes known to be fully written; readers never look past this
+        self.size = 0
+        self.last_offset = base - 1
+        # sparse (offset, position) pairs, every index_interval records
+        self.index: List[Tuple[int, int]] = []
+
+
+class Journal:
+    """
+    Append-only event log split into segment files of length-prefixed,
+    checksummed records.
+
+    ``append`` assigns the next offset and queues the record; a writer
+    thread batches whatever has queued up within ``commit_interval_ms``
+    into one write and one fsync (group commit). ``replay`` reads segments
+    through ``mmap`` and seeks with a sparse offset index. Named
+    checkpoints let a restarted subscriber continue after the last offset
+    it acknowledged; ``compact`` and ``retain`` keep disk use bounded.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, index_interval: int = 64,
+                 fsync: bool = True, commit_interval_ms: float = 2.0, max_batch: int = 4096,
+                 dumps: Callable[[Any], bytes] = None, loads: Callable[[bytes], Any] = None,
+                 checkpoint_interval: int = 100):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_interval = index_interval
+        self.fsync = fsync
+        self.commit_interval = commit_interval_ms / 1000
+        self.max_batch = max_batch
+        self.checkpoint_interval = checkpoint_interval
+        self._dumps = dumps or (lambda event: pickle.dumps(event, pickle.HIGHEST_PROTOCOL))
+        self._loads = loads or pickle.loads
+        self._checkpoint_dir = os.path.join(directory, "checkpoints")
+        os.makedirs(self._checkpoint_dir, exist_ok=True)
+
+        self._segments: List[_Segment] = []
+        self._segments_lock = threading.Lock()
+        self._pending: Deque[Tuple[int, bytes]] = deque()
+        self._cond = threading.Condition()
+        self._committed = -1
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._checkpoints: Dict[str, int] = {}
+        self._unsaved_acks: Dict[str, int] = {}
+        # per name: offsets durable subscribers are still handling, and the highest one they finished
+        self._running: Dict[str, Set[int]] = {}
+        self._completed: Dict[str, int] = {}
+        self._checkpoint_lock = threading.Lock()
+
+        self._recover()
+        self._next_offset = self._committed + 1
+        self._file = open(self._segments[-1].path, "ab")
+        self._index_file = open(self._segments[-1].index_path, "ab")
+        self._writer = threading.Thread(target=self._write_loop, name="argo-journal", daemon=True)
+        self._writer.start()
+
+    @property
+    def next_offset(self) -> int:
+        return self._next_offset
+
+    @property
+    def committed_offset(self) -> int:
+        """Highest offset that is on disk (and fsynced when ``fsync`` is on); -1 when empty."""
+        return self._committed
+
+    def append(self, topic: str, event: Any) -> int:
+        topic_bytes = topic.encode("utf-8")
+        payload = topic_bytes + self._dumps(event)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("journal is closed")
+            if self._error is not None:
+                raise self._error
+            offset = self._next_offset
+            self._next_offset += 1
+            crc = zlib.crc32(payload, zlib.crc32(offset.to_bytes(8, "little")))
+            self._pending.append((offset, _HEADER.pack(len(payload), crc, offset, len(topic_bytes)) + payload))
+            self._cond.notify_all()
+        return offset
+
+    def wait(self, offset: int, timeout: Optional[float] = None) -> bool:
+        """Block until ``offset`` is committed; False on timeout."""
+        with self._cond:
+            done = self._cond.wait_for(lambda: self._committed >= offset or self._error is not None, timeout)
+            if self._error is not None:
+                raise self._error
+            return done
+
+    def sync(self, timeout: Optional[float] = None) -> bool:
+        return self.wait(self._next_offset - 1, timeout)
+
+    def replay(self, from_offset: int = 0, topic: Optional[str] = None) -> Iterator[Record]:
+        """
+        Yield ``(offset, topic, event)`` for committed records at or after
+        ``from_offset``; ``topic`` may be a dotted pattern as on the bus.
+        """
+        matcher = None
+        if topic is not None:
+            matcher = TopicTrie()
+            matcher.add(topic, True)
+        with self._segments_lock:
+            segments = [(s, s.size, list(s.index)) for s in self._segments]
+        bases = [s.base for s, _, _ in segments]
+        start = max(0, bisect.bisect_right(bases, from_offset) - 1)
+        for segment, size, index in segments[start:]:
+            if size == 0 or segment.last_offset < from_offset:
+                continue
+            position = 0
+            # closest indexed record at or before from_offset
+            i = bisect.bisect_right(index, (from_offset, float("inf"))) - 1
+            if i >= 0:
+                position = index[i][1]
+            for offset, record_topic, event_bytes in self._read(segment.path, size, position):
+                if offset < from_offset:
+                    continue
+                if matcher is not None and not any(True for _ in matcher.match(record_topic)):
+                    continue
+                yield offset, record_topic, self._loads(event_bytes)
+
+    def checkpoint(self, name: str) -> int:
+        """Last offset acknowledged by ``name``, -1 if it never acknowledged one."""
+        with self._checkpoint_lock:
+            if name in self._checkpoints:
+                return self._checkpoints[name]
+        path = self._checkpoint_path(name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                offset = int(json.load(f)["offset"])
+        except (OSError, ValueError, KeyError):
+            offset = -1
+        with self._checkpoint_lock:
+            return self._checkpoints.setdefault(name, offset)
+
+    def ack(self, name: str, offset: int):
+        """
+        Record that ``name`` has handled everything up to ``offset``. While
+        ``durable`` subscribers of ``name`` are still handling earlier
+        offsets the checkpoint stops just short of the oldest of them. Saved
+        to disk every ``checkpoint_interval`` acks and on close, so a crash
+        can replay at most that many events to the subscriber again.
+        """
+        self._settle(name, offset, True)
+
+    def _begin(self, name: str, offset: int):
+        self.checkpoint(name)
+        with self._checkpoint_lock:
+            self._running.setdefault(name, set()).add(offset)
+
+    def _settle(self, name: str, offset: int, completed: bool):
+        self.checkpoint(name)
+        with self._checkpoint_lock:
+            running = self._running.get(name)
+            if running:
+                running.discard(offset)
+            if completed:
+                self._completed[name] = max(self._completed.get(name, -1), offset)
+            target = self._completed.get(name, -1)
+            if running:
+                target = min(target, min(running) - 1)
+            if target <= self._checkpoints[name]:
+                return
+            self._checkpoints[name] = target
+            count = self._unsaved_acks.get(name, 0) + 1
+            self._unsaved_acks[name] = count
+            if count < self.checkpoint_interval:
+                return
+            self._unsaved_acks[name] = 0
+        self._save_checkpoint(name, target)
+
+    def flush_checkpoints(self):
+        with self._checkpoint_lock:
+            dirty = [(name, self._checkpoints[name]) for name, count in self._unsaved_acks.items() if count]
+            self._unsaved_acks.clear()
+        for name, offset in dirty:
+            self._save_checkpoint(name, offset)
+
+    def resume(self, name: str, topic: str, callback: Callable[[Any], Any]) -> int:
+        """
+        Feed ``callback`` every ``topic`` event after ``name``'s checkpoint,
+        acknowledging as it goes; returns how many events were replayed.
+        """
+        count = 0
+        for offset, _, event in self.replay(self.checkpoint(name) + 1, topic):
+            token = _current_offset.set(offset)
+            try:
+                callback(event)
+            finally:
+                _current_offset.reset(token)
+            self.ack(name, offset)
+            count += 1
+        self.flush_checkpoints()
+        return count
+
+    def durable(self, name: str, callback: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        """
+        Wrap a bus subscriber so each event it handles without raising is
+        acknowledged as ``name``. The offset travels in a contextvar, so this
+        covers inline, async and queued subscribers; pool workers run outside
+        the publisher's context and are not acknowledged. Events still being
+        handled hold the checkpoint back, so it only moves past an event once
+        that event is done; one that raised no longer holds it. Keyed queues
+        with several workers may start events out of order, so the bus
+        refuses durable subscribers there.
+        """
+        def start():
+            offset = _current_offset.get()
+            if offset is not None:
+                self._begin(name, offset)
+            return offset
+
+        if inspect.iscoroutinefunction(callback):
+            async def acknowledged_async(event):
+                offset = start()
+                completed = False
+                try:
+                    result = await callback(event)
+                    completed = True
+                finally:
+                    if offset is not None:
+                        self._settle(name, offset, completed)
+                return result
+            acknowledged_async.journal = self
+            return acknowledged_async
+
+        def acknowledged(event):
+            offset = start()
+            completed = False
+            try:
+                result = callback(event)
+                completed = True
+            finally:
+                if offset is not None:
+                    self._settle(name, offset, completed)
+            return result
+        acknowledged.journal = self
+        return acknowledged
+
+    def retain(self, max_bytes: Optional[int] = None, max_segments: Optional[int] = None,
+               max_age_s: Optional[float] = None, keep_unacknowledged: bool = True) -> int:
+        """
+        Delete the oldest closed segments until the limits hold. With
+        ``keep_unacknowledged`` a segment is kept while any checkpoint still
+        points before its end. Returns the number of segments removed.
+        """
+        floor = None
+        if keep_unacknowledged:
+            self.flush_checkpoints()
+            names = [os.path.splitext(os.path.basename(p))[0]
+                     for p in glob.glob(os.path.join(self._checkpoint_dir, "*.json"))]
+            if names:
+                floor = min(self.checkpoint(name) for name in names)
+        removed = 0
+        now = time.time()
+        with self._segments_lock:
+            while len(self._segments) > 1:
+                oldest = self._segments[0]
+                total = sum(s.size for s in self._segments)
+                too_big = max_bytes is not None and total > max_bytes
+                too_many = max_segments is not None and len(self._segments) > max_segments
+                too_old = max_age_s is not None and now - _mtime(oldest.path) > max_age_s
+                if not (too_big or too_many or too_old):
+                    break
+                if floor is not None and oldest.last_offset > floor:
+                    break
+                self._segments.pop(0)
+                _remove(oldest.path)
+                _remove(oldest.index_path)
+                removed += 1
+        return removed
+
+    def compact(self, key: Callable[[str, Any], Any]) -> int:
+        """
+        Rewrite closed segments keeping only the newest record per
+        ``key(topic, event)``; records whose key is None are always kept.
+        Offsets do not change. Returns the number of records dropped.
+        """
+        latest: Dict[Any, int] = {}
+        for offset, topic, event in self.replay(0):
+            k = key(topic, event)
+            if k is not None:
+                latest[k] = offset
+        with self._segments_lock:
+            closed = self._segments[:-1]
+        dropped = 0
+        for segment in closed:
+            kept: List[bytes] = []
+            index: List[Tuple[int, int]] = []
+            position = 0
+            last_offset = segment.base - 1
+            for offset, topic, event_bytes in self._read(segment.path, segment.size, 0):
+                k = key(topic, self._loads(event_bytes))
+                if k is not None and latest.get(k) != offset:
+                    dropped += 1
+                    continue
+                topic_bytes = topic.encode("utf-8")
+                payload = topic_bytes + event_bytes
+                crc = zlib.crc32(payload, zlib.crc32(offset.to_bytes(8, "little")))
+                record = _HEADER.pack(len(payload), crc, offset, len(topic_bytes)) + payload
+                if len(kept) % self.index_interval == 0:
+                    index.append((offset, position))
+                kept.append(record)
+                position += len(record)
+                last_offset = offset
+            if position == segment.size:
+                continue
+            data = b"".join(kept)
+            _write_atomic(segment.path, data)
+            _write_atomic(segment.index_path, b"".join(_INDEX_ENTRY.pack(o, p) for o, p in index))
+            with self._segments_lock:
+                segment.size = len(data)
+                segment.index = index
+                segment.last_offset = max(last_offset, segment.last_offset)
+        return dropped
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self._file.close()
+        self._index_file.close()
+        self.flush_checkpoints()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._closed)
+                if not self._pending and self._closed:
+                    return
+            if self.commit_interval and not self._closed:
+                # let concurrent appenders join this commit
+                time.sleep(self.commit_interval)
+            with self._cond:
+                batch = [self._pending.popleft() for _ in range(min(len(self._pending), self.max_batch))]
+            try:
+                self._write_batch(batch)
+            except BaseException as e:
+                logger.exception("[Journal] write to %s failed", self.directory)
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._committed = batch[-1][0]
+                self._cond.notify_all()
+
+    def _write_batch(self, batch: List[Tuple[int, bytes]]):
+        segment = self._segments[-1]
+        chunks: List[bytes] = []
+        index_chunks: List[bytes] = []
+        written = segment.size
+        count = 0
+        for offset, record in batch:
+            if written >= self.segment_bytes and written > 0:
+                self._commit(segment, chunks, index_chunks, written, offset - 1)
+                segment = self._roll(offset)
+                chunks, index_chunks, written = [], [], 0
+            records_in_segment = offset - segment.base
+            if records_in_segment % self.index_interval == 0:
+                index_chunks.append(_INDEX_ENTRY.pack(offset, written))
+            chunks.append(record)
+            written += len(record)
+            count += 1
+        self._commit(segment, chunks, index_chunks, written, batch[-1][0])
+
+    def _commit(self, segment: _Segment, chunks: List[bytes], index_chunks: List[bytes], size: int,
+                last_offset: int):
+        if chunks:
+            self._file.write(b"".join(chunks))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        if index_chunks:
+            # the index is rebuilt from the segment if lost, so it is not fsynced
+            self._index_file.write(b"".join(index_chunks))
+            self._index_file.flush()
+        new_entries = [_INDEX_ENTRY.unpack(c) for c in index_chunks]
+        with self._segments_lock:
+            segment.index.extend(new_entries)
+            segment.size = size
+            segment.last_offset = last_offset
+
+    def _roll(self, base: int) -> _Segment:
+        self._file.close()
+        self._index_file.close()
+        segment = _Segment(self.directory, base)
+        self._file = open(segment.path, "ab")
+        self._index_file = open(segment.index_path, "ab")
+        if self.fsync:
+            _fsync_dir(self.directory)
+        with self._segments_lock:
+            self._segments.append(segment)
+        return segment
+
+    def _recover(self):
+        for path in sorted(glob.glob(os.path.join(self.directory, f"*{_SEGMENT_SUFFIX}"))):
+            segment = _Segment(self.directory, int(os.path.basename(path)[:-len(_SEGMENT_SUFFIX)]))
+            segment.size = os.path.getsize(path)
+            segment.index = self._load_index(segment)
+            self._segments.append(segment)
+        if not self._segments:
+            segment = _Segment(self.directory, 0)
+            open(segment.path, "ab").close()
+            self._segments.append(segment)
+        # closed segments are never scanned at startup: they end where the next one begins
+        for previous, following in zip(self._segments, self._segments[1:]):
+            previous.last_offset = following.base - 1
+
+        # the active segment may end in a torn write: scan it from its last
+        # indexed record, keep the valid prefix and complete its index
+        active = self._segments[-1]
+        index = [entry for entry in active.index if entry[1] < active.size]
+        position = index.pop()[1] if index else 0
+        end = position
+        last_offset = active.base - 1
+        for offset, _, _, record_end in self._scan(active.path, active.size, position, strict=False):
+            if (offset - active.base) % self.index_interval == 0:
+                index.append((offset, end))
+            last_offset = offset
+            end = record_end
+        if end != active.size:
+            logger.warning("[Journal] truncating %d torn bytes from %s", active.size - end, active.path)
+            with open(active.path, "r+b") as f:
+                f.truncate(end)
+        with open(active.index_path, "wb") as f:
+            f.write(b"".join(_INDEX_ENTRY.pack(o, p) for o, p in index))
+        active.size = end
+        active.index = index
+        active.last_offset = last_offset
+        self._committed = last_offset
+
+    def _load_index(self, segment: _Segment) -> List[Tuple[int, int]]:
+        try:
+            with open(segment.index_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            data = b""
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        entries = [_INDEX_ENTRY.unpack_from(data, i) for i in range(0, usable, _INDEX_ENTRY.size)]
+        if entries or not segment.size:
+            return entries
+        # lost index: rebuild it from the records
+        position = 0
+        for i, (offset, _, _, end) in enumerate(self._scan(segment.path, segment.size, 0, strict=False)):
+            if i % self.index_interval == 0:
+                entries.append((offset, position))
+            position = end
+        return entries
+
+    def _read(self, path: str, size: int, position: int) -> Iterator[Tuple[int, str, bytes]]:
+        for offset, topic, event_bytes, _ in self._scan(path, size, position, strict=True):
+            yield offset, topic, event_bytes
+
+    def _scan(self, path: str, size: int, position: int, strict: bool) -> Iterator[Tuple[int, str, bytes, int]]:
+        if size == 0:
+            return
+        try:
+            f = open(path, "rb")
+        except FileNotFoundError:
+            # removed by retention while a replay was in progress
+            return
+        with f:
+            # compaction may have shrunk the file since the caller looked
+            size = min(size, os.fstat(f.fileno()).st_size)
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as view:
+                yield from self._parse(view, path, size, position, strict)
+
+    def _parse(self, view: mmap.mmap, path: str, size: int, position: int,
+               strict: bool) -> Iterator[Tuple[int, str, bytes, int]]:
+        while position + _HEADER.size <= size:
+            length, crc, offset, topic_length = _HEADER.unpack_from(view, position)
+            start = position + _HEADER.size
+            end = start + length
+            if end > size:
+                break
+            payload = view[start:end]
+            if zlib.crc32(payload, zlib.crc32(offset.to_bytes(8, "little"))) != crc:
+                if strict:
+                    raise JournalCorruptError(f"bad checksum at {path}:{position}")
+                break
+            yield offset, payload[:topic_length].decode("utf-8"), payload[topic_length:], end
+            position = end
+        if strict and position != size:
+            raise JournalCorruptError(f"truncated record at {path}:{position}")
+
+    def _checkpoint_path(self, name: str) -> str:
+        if not name or os.sep in name or name.startswith("."):
+            raise ValueError(f"invalid checkpoint name {name!r}")
+        return os.path.join(self._checkpoint_dir, f"{name}.json")
+
+    def _save_checkpoint(self, name: str, offset: int):
+        _write_atomic(self._checkpoint_path(name), json.dumps({"offset": offset}).encode("utf-8"))
+
+
+def _write_atomic(path: str, data: bytes):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        _remove(tmp)
+        raise
+
+
+def _fsync_dir(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
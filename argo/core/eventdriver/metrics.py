@@ -0,0 +1,364 @@
+import contextvars
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Union
+
+if TYPE_CHECKING:
+    from argo.core.eventdriver.event_publisher import EventBus, Subscription
+    from argo.core.eventdriver.executors import OffloadedHandler
+
+OTHER_TOPICS = "__other__"
+
+
+class LatencyHistogram:
+    """
+    HDR-style histogram of nanosecond latencies in fixed memory.
+
+    Values below ``2 * 2**precision`` get a bucket each; above that every
+    power of two is split into ``2**precision`` linear sub-buckets, so the
+    relative error stays under ``2**-precision`` (about 3% by default) from
+    nanoseconds up to ``max_ns``.
+    """
+
+    def __init__(self, precision: int = 5, max_ns: int = 60 * 10**9):
+        self._sub_bits = precision
+        self._sub_count = 1 << precision
+        self._max_ns = max_ns
+        self.counts = [0] * (self._index(max_ns) + 1)
+        self.total = 0
+        self.sum = 0
+        self.min = 0
+        self.max = 0
+
+    def record(self, value_ns: int):
+        if value_ns < 0:
+            value_ns = 0
+        elif value_ns > self._max_ns:
+            value_ns = self._max_ns
+        self.counts[self._index(value_ns)] += 1
+        if not self.total or value_ns < self.min:
+            self.min = value_ns
+        if value_ns > self.max:
+            self.max = value_ns
+        self.total += 1
+        self.sum += value_ns
+
+    def percentile(self, q: float) -> int:
+        if not self.total:
+            return 0
+        rank = max(1, int(round(q / 100 * self.total)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.total,
+            "min_ns": self.min,
+            "mean_ns": self.sum // self.total if self.total else 0,
+            "p50_ns": self.percentile(50),
+            "p90_ns": self.percentile(90),
+            "p99_ns": self.percentile(99),
+            "p999_ns": self.percentile(99.9),
+            "max_ns": self.max,
+        }
+
+    def _index(self, value: int) -> int:
+        if value < 2 * self._sub_count:
+            return value
+        shift = value.bit_length() - self._sub_bits - 1
+        return 2 * self._sub_count + (shift - 1) * self._sub_count + (value >> shift) - self._sub_count
+
+    def _value(self, index: int) -> int:
+        # upper edge of the bucket, so percentiles never under-report
+        if index < 2 * self._sub_count:
+            return index
+        shift = (index - 2 * self._sub_count) // self._sub_count + 1
+        mantissa = (index - 2 * self._sub_count) % self._sub_count + self._sub_count
+        return ((mantissa + 1) << shift) - 1
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "topic", "subscriber", "start_ns", "end_ns", "error",
+                 "_token")
+
+    def __init__(self, trace_id: int, span_id: int, parent_id: Optional[int], topic: str, subscriber: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.topic = topic
+        self.subscriber = subscriber
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = 0
+        self.error: Optional[BaseException] = None
+        self._token: Optional[contextvars.Token] = None
+
+    @property
+    def duration_ns(self) -> int:
+        return self.end_ns - self.start_ns
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "topic": self.topic,
+            "subscriber": self.subscriber,
+            "duration_ns": self.duration_ns,
+            "error": repr(self.error) if self.error is not None else None,
+        }
+
+
+class SpanHook:
+    """
+    Receives a span around every instrumented subscriber call. A handler
+    that publishes further events passes its span on as their parent, so a
+    whole pipeline run shares one ``trace_id``.
+    """
+
+    def on_start(self, span: Span):
+        pass
+
+    def on_end(self, span: Span):
+        pass
+
+
+class MetricsExporter:
+    def export(self, snapshot: Dict[str, Any]):
+        raise NotImplementedError
+
+
+class LoggerExporter(MetricsExporter):
+    def __init__(self, target: Optional[logging.Logger] = None, level: int = logging.INFO):
+        if target is None:
+            from argo.utils.logger import logger as target
+        self.target = target
+        self.level = level
+
+    def export(self, snapshot: Dict[str, Any]):
+        self.target.log(self.level, "[Metrics] %s", _Json(snapshot))
+
+
+class JsonLinesExporter(MetricsExporter):
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, snapshot: Dict[str, Any]):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(snapshot, ensure_ascii=False))
+            f.write("\n")
+
+
+class _Json:
+    # renders lazily, on the logging listener thread
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self):
+        return json.dumps(self.value, ensure_ascii=False)
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("argo_event_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+# set by the bus around each delivery while metrics are on, so spans name the
+# published topic rather than the subscriber's pattern
+_published_topic: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("argo_event_topic", default=None)
+
+
+class _TopicStats:
+    __slots__ = ("count", "last_count")
+
+    def __init__(self):
+        self.count = 0
+        self.last_count = 0
+
+
+class _SubscriberStats:
+    __slots__ = ("name", "topic", "calls", "errors", "latency")
+
+    def __init__(self, name: str, topic: str, precision: int):
+        self.name = name
+        self.topic = topic
+        self.calls = 0
+        self.errors = 0
+        self.latency = LatencyHistogram(precision)
+
+
+class EventBusMetrics:
+    """
+    Counters, latency histograms and gauges for one ``EventBus``; installed
+    with ``EventBus.enable_metrics()``. Gauges are read from the bus when a
+    snapshot is taken, so they cost nothing on the publish path.
+    """
+
+    def __init__(self, bus: "EventBus", precision: int = 5, max_topics: int = 10000):
+        self._bus = bus
+        self._precision = precision
+        self._max_topics = max_topics
+        self._topics: Dict[str, _TopicStats] = {}
+        self._subscribers: Dict[Union["Subscription", "OffloadedHandler"], _SubscriberStats] = {}
+        self._span_hooks: List[SpanHook] = []
+        self._exporters: List[MetricsExporter] = []
+        self._ids = itertools.count(1)
+        self._started_ns = time.perf_counter_ns()
+        self._last_snapshot_ns = self._started_ns
+
+    def add_span_hook(self, hook: SpanHook):
+        self._span_hooks.append(hook)
+
+    def add_exporter(self, exporter: MetricsExporter):
+        self._exporters.append(exporter)
+
+    def record_publish(self, topic: str, count: int = 1):
+        stats = self._topics.get(topic)
+        if stats is None:
+            if len(self._topics) >= self._max_topics:
+                topic = OTHER_TOPICS
+            stats = self._topics.get(topic)
+            if stats is None:
+                stats = self._topics[topic] = _TopicStats()
+        stats.count += count
+
+    def instrument(self, subscription: "Subscription", callback: Callable[[Any], Any],
+                   is_async: bool) -> Callable[[Any], Any]:
+        stats = self._subscriber_stats(subscription)
+        if is_async:
+            async def timed_async(event):
+                span = self._start_span(stats)
+                start = time.perf_counter_ns()
+                try:
+                    return await callback(event)
+                except BaseException as e:
+                    stats.errors += 1
+                    if span is not None:
+                        span.error = e
+                    raise
+                finally:
+                    stats.calls += 1
+                    stats.latency.record(time.perf_counter_ns() - start)
+                    if span is not None:
+                        self._end_span(span)
+            return timed_async
+
+        def timed(event):
+            span = self._start_span(stats)
+            start = time.perf_counter_ns()
+            try:
+                return callback(event)
+            except BaseException as e:
+                stats.errors += 1
+                if span is not None:
+                    span.error = e
+                raise
+            finally:
+                stats.calls += 1
+                stats.latency.record(time.perf_counter_ns() - start)
+                if span is not None:
+                    self._end_span(span)
+        return timed
+
+    def observe_future(self, handler: "OffloadedHandler", future: Future):
+        # offloaded handlers may be pickled into another process, so they are
+        # timed from submit to completion on this side instead of wrapped
+        stats = self._subscriber_stats(handler)
+        start = time.perf_counter_ns()
+
+        def done(f):
+            stats.calls += 1
+            stats.latency.record(time.perf_counter_ns() - start)
+            if f.cancelled() or f.exception() is not None:
+                stats.errors += 1
+        future.add_done_callback(done)
+
+    def forget(self, subscription: "Subscription"):
+        self._subscribers.pop(subscription, None)
+        if subscription.offload is not None:
+            self._subscribers.pop(subscription.offload, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.perf_counter_ns()
+        since_start = max(now - self._started_ns, 1) / 1e9
+        since_last = max(now - self._last_snapshot_ns, 1) / 1e9
+        self._last_snapshot_ns = now
+        topics = {}
+        for topic, stats in list(self._topics.items()):
+            count = stats.count
+            topics[topic] = {
+                "published": count,
+                "rate_per_s": (count - stats.last_count) / since_last,
+                "avg_rate_per_s": count / since_start,
+            }
+            stats.last_count = count
+        subscribers = []
+        for stats in list(self._subscribers.values()):
+            subscribers.append({
+                "subscriber": stats.name,
+                "topic": stats.topic,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "latency": stats.latency.snapshot(),
+            })
+        bus = self._bus
+        dispatchers = list(bus._dispatchers)
+        return {
+            "uptime_s": since_start,
+            "topics": topics,
+            "subscribers": subscribers,
+            "gauges": {
+                "in_flight_tasks": len(bus._tasks),
+                "in_flight_offloaded": len(bus._futures),
+                "queue_depth": sum(d.depth for d in dispatchers),
+                "queue_dropped": sum(d.dropped for d in dispatchers),
+                "batched_pending": sum(len(b) for b in list(bus._batchers)),
+            },
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False)
+
+    def export(self) -> Dict[str, Any]:
+        snapshot = self.snapshot()
+        for exporter in self._exporters:
+            exporter.export(snapshot)
+        return snapshot
+
+    def _subscriber_stats(self, owner: Union["Subscription", "OffloadedHandler"]) -> _SubscriberStats:
+        stats = self._subscribers.get(owner)
+        if stats is None:
+            name = getattr(owner.callback, "__qualname__", repr(owner.callback))
+            stats = self._subscribers[owner] = _SubscriberStats(name, owner.event_type, self._precision)
+        return stats
+
+    def _start_span(self, stats: _SubscriberStats) -> Optional[Span]:
+        if not self._span_hooks:
+            return None
+        parent = _current_span.get()
+        span = Span(parent.trace_id if parent is not None else next(self._ids), next(self._ids),
+                    parent.span_id if parent is not None else None, _published_topic.get() or stats.topic,
+                    stats.name)
+        # sync handlers share the publisher's context, so the previous span is
+        # restored in _end_span; async handlers run in their task's own copy
+        span._token = _current_span.set(span)
+        for hook in self._span_hooks:
+            hook.on_start(span)
+        return span
+
+    def _end_span(self, span: Span):
+        span.end_ns = time.perf_counter_ns()
+        _current_span.reset(span._token)
+        for hook in self._span_hooks:
+            hook.on_end(span)
+
@@ -0,0 +1,115 @@
+import struct
+import sys
+import threading
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Optional, Tuple
+
+# capacity, then the absolute write position (bytes ever written, including
+# wrap padding); the mapping itself may be rounded up to a page
+_HEADER = struct.Struct("<QQ")
+_HEAD = struct.Struct("<Q")
+_HEAD_OFFSET = 8
+
+ShmRef = Tuple[str, int, int]
+
+
+class ShmOverrunError(RuntimeError):
+    """The writer wrapped around and reused the space before the reader copied it out."""
+
+
+class ShmRing:
+    """
+    Single-writer ring buffer in shared memory for large event payloads.
+
+    The owning process ``put`` s a blob and sends only the small reference
+    ``(name, position, length)`` over the transport; readers in other
+    processes ``get`` it straight from shared memory, so big markdown or
+    image data never passes through the broker socket. Nothing is freed
+    explicitly: old blobs are overwritten as the writer wraps, and a reader
+    that comes too late gets ``ShmOverrunError`` instead of wrong data.
+    Size the ring for the payload volume in flight.
+    """
+
+    def __init__(self, size: int = 64 * 1024 * 1024, name: Optional[str] = None):
+        self._shm = shared_memory.SharedMemory(name=name, create=True, size=_HEADER.size + size)
+        self.name = self._shm.name
+        self.capacity = size
+        self._head = 0
+        self._lock = threading.Lock()
+        _HEADER.pack_into(self._shm.buf, 0, size, 0)
+
+    def put(self, data: bytes) -> ShmRef:
+        length = len(data)
+        if length > self.capacity:
+            raise ValueError(f"payload of {length} bytes does not fit a {self.capacity} byte ring")
+        with self._lock:
+            position = self._head
+            offset = position % self.capacity
+            if offset + length > self.capacity:
+                # never split a blob across the end; skip to the start instead
+                position += self.capacity - offset
+                offset = 0
+            self._head = position + length
+            # publish the new head before overwriting, so a reader still
+            # copying old data there sees that it lost the race
+            _HEAD.pack_into(self._shm.buf, _HEAD_OFFSET, self._head)
+            start = _HEADER.size + offset
+            self._shm.buf[start:start + length] = data
+        return self.name, position, length
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+class ShmReader:
+    """Reads blobs out of the rings of other processes, attaching to each ring once."""
+
+    def __init__(self):
+        self._rings: Dict[str, shared_memory.SharedMemory] = {}
+        self._lock = threading.Lock()
+
+    def get(self, ref: ShmRef) -> bytes:
+        name, position, length = ref
+        shm = self._attach(name)
+        capacity = _HEAD.unpack_from(shm.buf, 0)[0]
+        start = _HEADER.size + position % capacity
+        data = bytes(shm.buf[start:start + length])
+        head = _HEAD.unpack_from(shm.buf, _HEAD_OFFSET)[0]
+        if head > position + capacity:
+            raise ShmOverrunError(f"blob at {position} in {name} was overwritten before it was read")
+        return data
+
+    def close(self):
+        with self._lock:
+            rings, self._rings = self._rings, {}
+        for shm in rings.values():
+            shm.close()
+
+    def _attach(self, name: str) -> shared_memory.SharedMemory:
+        shm = self._rings.get(name)
+        if shm is None:
+            with self._lock:
+                shm = self._rings.get(name)
+                if shm is None:
+                    shm = self._rings[name] = _attach_untracked(name)
+        return shm
+
+
+_register_lock = threading.Lock()
+
+
+def _attach_untracked(name: str) -> shared_memory.SharedMemory:
+    # the ring belongs to its writer, so a reader must not register it with
+    # the resource tracker, which would unlink it when the reader exits.
+    # Unregistering afterwards is not enough: forked processes share their
+    # parent's tracker and would drop the writer's own registration
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    with _register_lock:
+        register = resource_tracker.register
+        resource_tracker.register = lambda *args: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
@@ -0,0 +1,88 @@
+from typing import Dict, Iterator, List, Optional
+
+SEPARATOR = "."
+SINGLE_WILDCARD = "*"
+MULTI_WILDCARD = "#"
+
+
+class _Node:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # dict keeps insertion order and gives O(1) removal
+        self.entries: Dict[object, None] = {}
+
+
+class TopicTrie:
+    """
+    Dotted topic patterns stored per segment.
+
+    ``*`` matches exactly one segment, ``#`` matches zero or more segments,
+    so ``pipeline.step.*`` matches ``pipeline.step.done`` and ``pipeline.#``
+    matches ``pipeline`` as well as ``pipeline.step.done``.
+    """
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, pattern: str, entry: object):
+        node = self._root
+        for segment in pattern.split(SEPARATOR):
+            child = node.children.get(segment)
+            if child is None:
+                child = node.children[segment] = _Node()
+            node = child
+        if entry not in node.entries:
+            node.entries[entry] = None
+            self._size += 1
+
+    def remove(self, pattern: str, entry: object) -> bool:
+        path: List[tuple] = []
+        node = self._root
+        for segment in pattern.split(SEPARATOR):
+            child = node.children.get(segment)
+            if child is None:
+                return False
+            path.append((node, segment))
+            node = child
+        if entry not in node.entries:
+            return False
+        del node.entries[entry]
+        self._size -= 1
+        # prune empty branches so long-lived buses don't accumulate dead nodes
+        for parent, segment in reversed(path):
+            child = parent.children[segment]
+            if child.entries or child.children:
+                break
+            del parent.children[segment]
+        return True
+
+    def match(self, topic: str) -> Iterator[object]:
+        segments = topic.split(SEPARATOR)
+        seen = set()
+        for node in self._match(self._root, segments, 0):
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            yield from node.entries
+
+    def _match(self, node: _Node, segments: List[str], index: int) -> Iterator[_Node]:
+        multi = node.children.get(MULTI_WILDCARD)
+        if multi is not None:
+            # '#' may swallow any number of the remaining segments, including none
+            for i in range(index, len(segments) + 1):
+                yield from self._match(multi, segments, i)
+        if index == len(segments):
+            yield node
+            return
+        exact: Optional[_Node] = node.children.get(segments[index])
+        if exact is not None:
+            yield from self._match(exact, segments, index + 1)
+        single = node.children.get(SINGLE_WILDCARD)
+        if single is not None:
+            yield from self._match(single, segments, index + 1)
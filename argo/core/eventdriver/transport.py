@@ -0,0 +1,446 @@
+import argparse
+import multiprocessing
+import os
+import selectors
+import socket
+import struct
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from argo.core.eventdriver import codec
+from argo.core.eventdriver.shm_ring import ShmReader, ShmRing
+from argo.core.eventdriver.topic_trie import TopicTrie
+from argo.utils.logger import logger
+
+# frame: body length, message type, body
+_FRAME = struct.Struct("<IB")
+_TOPIC = struct.Struct("<H")
+_SHM_REF = struct.Struct("<QI")
+
+SUBSCRIBE = 1
+UNSUBSCRIBE = 2
+PUBLISH = 3
+# broker -> client: the groups an event is for, then the PUBLISH body
+DELIVER = 4
+
+# group of the subscribers that get every matching event
+BROADCAST = ""
+
+# how a PUBLISH body carries its event
+_INLINE = 0
+_SHARED = 1
+
+# deliver(topic, event, groups): ``groups`` names the subscriber groups
+# the event is for in this process, ``BROADCAST`` standing for the
+# subscribers without a group
+Deliver = Callable[[str, Any, Tuple[str, ...]], None]
+
+
+class Transport:
+    """
+    Carries events between ``EventBus`` instances in different processes.
+    The bus forwards its subscription patterns and every publish; events
+    that arrive from other processes are handed to ``deliver``.
+
+    Patterns subscribed without a group get every matching event published
+    by any other process. Patterns subscribed with a group compete: each
+    event goes to just one of the processes subscribed with that group,
+    which may be the publisher itself.
+    """
+
+    def attach(self, deliver: Optional[Deliver]):
+        raise NotImplementedError
+
+    def subscribe(self, pattern: str, group: Optional[str] = None):
+        raise NotImplementedError
+
+    def unsubscribe(self, pattern: str, group: Optional[str] = None):
+        raise NotImplementedError
+
+    def send(self, topic: str, event: Any):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _frame(message_type: int, body: bytes) -> bytes:
+    return _FRAME.pack(len(body), message_type) + body
+
+
+def _frames(buffer: bytearray):
+    """Pop every complete frame off the front of ``buffer``."""
+    position = 0
+    while len(buffer) - position >= _FRAME.size:
+        length, message_type = _FRAME.unpack_from(buffer, position)
+        end = position + _FRAME.size + length
+        if end > len(buffer):
+            break
+        yield message_type, bytes(buffer[position + _FRAME.size:end])
+        position = end
+    del buffer[:position]
+
+
+def _publish_topic(body: bytes) -> str:
+    (length,) = _TOPIC.unpack_from(body, 0)
+    return body[_TOPIC.size:_TOPIC.size + length].decode("utf-8")
+
+
+def _pack_string(value: str) -> bytes:
+    data = value.encode("utf-8")
+    return _TOPIC.pack(len(data)) + data
+
+
+def _unpack_string(body: bytes, position: int) -> Tuple[str, int]:
+    (length,) = _TOPIC.unpack_from(body, position)
+    position += _TOPIC.size
+    return body[position:position + length].decode("utf-8"), position + length
+
+
+def _subscription(body: bytes) -> Tuple[str, str]:
+    # SUBSCRIBE / UNSUBSCRIBE: group, then the pattern
+    group, position = _unpack_string(body, 0)
+    return body[position:].decode("utf-8"), group
+
+
+class _Client:
+    __slots__ = ("sock", "inbox", "outbox", "patterns")
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.inbox = bytearray()
+        self.outbox = bytearray()
+        # (pattern, group) -> subscription count
+        self.patterns: Dict[Tuple[str, str], int] = {}
+
+
+# clients with a matching broadcast pattern, and the members of each group
+# with a matching pattern
+_Targets = Tuple[List[_Client], Dict[str, List[_Client]]]
+
+
+class Broker:
+    """
+    Small local broker on a Unix domain socket. Clients register topic
+    patterns, optionally in a named group; each published event is
+    forwarded to every other client with a matching broadcast pattern, and
+    to one member of each group with a matching pattern, taking turns, so
+    N worker processes in a group share the load instead of each handling
+    everything. Payloads are passed through without being decoded. A client
+    whose unsent backlog exceeds ``max_backlog`` is disconnected rather than
+    letting it stall or bloat the broker.
+    """
+
+    def __init__(self, path: str, max_backlog: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_backlog = max_backlog
+        self._selector = selectors.DefaultSelector()
+        self._clients: Dict[socket.socket, _Client] = {}
+        self._trie = TopicTrie()
+        self._routes: Dict[str, _Targets] = {}
+        self._turns: Dict[str, int] = {}
+        self._server: Optional[socket.socket] = None
+        self._stopping = threading.Event()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+
+    def start(self) -> threading.Thread:
+        self._listen()
+        thread = threading.Thread(target=self._loop, name="argo-broker", daemon=True)
+        thread.start()
+        return thread
+
+    def serve_forever(self):
+        self._listen()
+        self._loop()
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup_w.send(b"\0")
+
+    def _listen(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.path)
+        server.listen()
+        server.setblocking(False)
+        self._server = server
+        self._selector.register(server, selectors.EVENT_READ)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+
+    def _loop(self):
+        try:
+            while not self._stopping.is_set():
+                for key, events in self._selector.select():
+                    sock = key.fileobj
+                    if sock is self._server:
+                        self._accept()
+                    elif sock is self._wakeup_r:
+                        sock.recv(64)
+                    else:
+                        client = self._clients.get(sock)
+                        if client is None:
+                            continue
+                        if events & selectors.EVENT_READ:
+                            self._read(client)
+                        if events & selectors.EVENT_WRITE and client.sock in self._clients:
+                            self._flush(client)
+        finally:
+            for client in list(self._clients.values()):
+                self._drop(client)
+            self._selector.close()
+            self._server.close()
+            self._wakeup_r.close()
+            self._wakeup_w.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _accept(self):
+        sock, _ = self._server.accept()
+        sock.setblocking(False)
+        self._clients[sock] = _Client(sock)
+        self._selector.register(sock, selectors.EVENT_READ)
+
+    def _read(self, client: _Client):
+        try:
+            data = client.sock.recv(1 << 20)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+        if not data:
+            self._drop(client)
+            return
+        client.inbox += data
+        for message_type, body in _frames(client.inbox):
+            try:
+                if message_type == PUBLISH:
+                    topic = _publish_topic(body)
+                elif message_type in (SUBSCRIBE, UNSUBSCRIBE):
+                    pattern, group = _subscription(body)
+            except (ValueError, struct.error):
+                # one misbehaving client must not take the broker down with it
+                logger.warning("[Broker] dropping client that sent a malformed frame")
+                self._drop(client)
+                return
+            if message_type == PUBLISH:
+                self._forward(client, topic, body)
+            elif message_type == SUBSCRIBE:
+                self._subscribe(client, pattern, group)
+            elif message_type == UNSUBSCRIBE:
+                self._unsubscribe(client, pattern, group)
+            if client.sock not in self._clients:
+                # _forward dropped the sender for its backlog
+                return
+
+    def _forward(self, sender: _Client, topic: str, body: bytes):
+        targets = self._routes.get(topic)
+        if targets is None:
+            targets = self._routes[topic] = self._targets(topic)
+        broadcast, groups = targets
+        deliveries: Dict[_Client, List[str]] = {client: [BROADCAST] for client in broadcast if client is not sender}
+        for group, members in groups.items():
+            turn = self._turns.get(group, 0)
+            self._turns[group] = turn + 1
+            deliveries.setdefault(members[turn % len(members)], []).append(group)
+        for client, names in deliveries.items():
+            header = _TOPIC.pack(len(names)) + b"".join(_pack_string(name) for name in names)
+            was_idle = not client.outbox
+            client.outbox += _FRAME.pack(len(header) + len(body), DELIVER)
+            client.outbox += header
+            client.outbox += body
+            if len(client.outbox) > self.max_backlog:
+                logger.warning("[Broker] dropping client with %d unsent bytes", len(client.outbox))
+                self._drop(client)
+            elif was_idle:
+                self._flush(client)
+
+    def _targets(self, topic: str) -> _Targets:
+        broadcast: Dict[_Client, None] = {}
+        groups: Dict[str, Dict[_Client, None]] = {}
+        for client, group in self._trie.match(topic):
+            if group == BROADCAST:
+                broadcast[client] = None
+            else:
+                groups.setdefault(group, {})[client] = None
+        return list(broadcast), {group: list(members) for group, members in groups.items()}
+
+    def _flush(self, client: _Client):
+        try:
+            sent = client.sock.send(client.outbox)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._drop(client)
+            return
+        del client.outbox[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if client.outbox else 0)
+        self._selector.modify(client.sock, events)
+
+    def _subscribe(self, client: _Client, pattern: str, group: str):
+        key = (pattern, group)
+        client.patterns[key] = client.patterns.get(key, 0) + 1
+        if client.patterns[key] == 1:
+            self._trie.add(pattern, (client, group))
+            self._routes = {}
+
+    def _unsubscribe(self, client: _Client, pattern: str, group: str):
+        key = (pattern, group)
+        count = client.patterns.get(key, 0) - 1
+        if count > 0:
+            client.patterns[key] = count
+            return
+        if client.patterns.pop(key, None) is not None:
+            self._trie.remove(pattern, (client, group))
+            self._routes = {}
+
+    def _drop(self, client: _Client):
+        if self._clients.pop(client.sock, None) is None:
+            return
+        for pattern, group in client.patterns:
+            self._trie.remove(pattern, (client, group))
+        self._routes = {}
+        self._selector.unregister(client.sock)
+        client.sock.close()
+
+
+class UnixSocketTransport(Transport):
+    """
+    Client side of ``Broker``. Events are encoded with ``codec``; encoded
+    payloads of ``shm_threshold`` bytes or more are written to this
+    process's ``ShmRing`` and only a reference goes over the socket.
+    Incoming events are delivered on a reader thread.
+    """
+
+    def __init__(self, path: str, shm_threshold: Optional[int] = 64 * 1024,
+                 shm_size: int = 64 * 1024 * 1024):
+        self.path = path
+        self.shm_threshold = shm_threshold
+        self._shm_size = shm_size
+        self._ring: Optional[ShmRing] = None
+        self._reader = ShmReader()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(path)
+        self._send_lock = threading.Lock()
+        self._patterns: Dict[Tuple[str, str], int] = {}
+        self._deliver: Optional[Deliver] = None
+        self._closed = False
+        self._thread = threading.Thread(target=self._receive_loop, name="argo-transport", daemon=True)
+        self._thread.start()
+
+    def attach(self, deliver: Optional[Deliver]):
+        self._deliver = deliver
+
+    def subscribe(self, pattern: str, group: Optional[str] = None):
+        # the broker only needs to hear about a pattern once per process
+        key = (pattern, group or BROADCAST)
+        with self._send_lock:
+            self._patterns[key] = self._patterns.get(key, 0) + 1
+            if self._patterns[key] == 1:
+                self._sock.sendall(_frame(SUBSCRIBE, _pack_string(key[1]) + pattern.encode("utf-8")))
+
+    def unsubscribe(self, pattern: str, group: Optional[str] = None):
+        key = (pattern, group or BROADCAST)
+        with self._send_lock:
+            count = self._patterns.get(key, 0) - 1
+            if count > 0:
+                self._patterns[key] = count
+                return
+            if self._patterns.pop(key, None) is not None:
+                self._sock.sendall(_frame(UNSUBSCRIBE, _pack_string(key[1]) + pattern.encode("utf-8")))
+
+    def send(self, topic: str, event: Any):
+        data = codec.encode(event)
+        if self.shm_threshold is not None and len(data) >= self.shm_threshold and len(data) <= self._shm_size:
+            if self._ring is None:
+                self._ring = ShmRing(self._shm_size)
+            name, position, length = self._ring.put(data)
+            payload = bytes((_SHARED,)) + _pack_string(name) + _SHM_REF.pack(position, length)
+        else:
+            payload = bytes((_INLINE,)) + data
+        body = _pack_string(topic) + payload
+        with self._send_lock:
+            self._sock.sendall(_frame(PUBLISH, body))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._thread.join(timeout=5)
+        self._reader.close()
+        if self._ring is not None:
+            self._ring.close()
+
+    def _receive_loop(self):
+        inbox = bytearray()
+        while True:
+            try:
+                data = self._sock.recv(1 << 20)
+            except OSError:
+                data = b""
+            if not data:
+                if not self._closed:
+                    logger.error("[Transport] lost connection to broker at %s", self.path)
+                return
+            inbox += data
+            for message_type, body in _frames(inbox):
+                if message_type != DELIVER:
+                    continue
+                try:
+                    groups, topic, event = self._decode_delivery(body)
+                except Exception:
+                    logger.exception("[Transport] can not decode event")
+                    continue
+                deliver = self._deliver
+                if deliver is None:
+                    continue
+                try:
+                    deliver(topic, event, groups)
+                except Exception:
+                    logger.exception("[Transport] subscriber failed on %s", topic)
+
+    def _decode_delivery(self, body: bytes):
+        groups = []
+        (count,) = _TOPIC.unpack_from(body, 0)
+        position = _TOPIC.size
+        for _ in range(count):
+            group, position = _unpack_string(body, position)
+            groups.append(group)
+        topic, position = _unpack_string(body, position)
+        kind = body[position]
+        position += 1
+        if kind == _INLINE:
+            return tuple(groups), topic, codec.decode(body[position:])
+        name, position = _unpack_string(body, position)
+        shm_position, length = _SHM_REF.unpack_from(body, position)
+        return tuple(groups), topic, codec.decode(self._reader.get((name, shm_position, length)))
+
+
+def spawn_broker(path: str) -> multiprocessing.Process:
+    """Run a ``Broker`` in its own process; returns once the socket accepts connections."""
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_run_broker, args=(path, ready), name="argo-broker", daemon=True)
+    process.start()
+    if not ready.wait(10):
+        process.terminate()
+        raise RuntimeError(f"broker at {path} did not start")
+    return process
+
+
+def _run_broker(path: str, ready=None):
+    broker = Broker(path)
+    broker._listen()
+    if ready is not None:
+        ready.set()
+    broker._loop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the argo event broker on a Unix domain socket.")
+    parser.add_argument("--path", default="/tmp/argo-events.sock")
+    _run_broker(parser.parse_args().path)
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+CACHE_DIR = ".argo-cache"
+_CHUNK = 1024 * 1024
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed store for step outputs under ``<root>/.argo-cache``.
+
+    ``objects/<sha256>`` holds every output file once, whatever step or run
+    produced it; ``manifests/<key>.json`` maps a step key (hash of the
+    step's inputs and config) to the digests of the outputs it produced.
+    A step whose key has a manifest does not need to run again: missing
+    outputs are copied back from ``objects``, and outputs that exist are
+    left alone even when they changed, since they may have been edited by
+    hand; steps that read them see the new content as a changed input.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self.cache_dir = os.path.join(self.root, CACHE_DIR)
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+
+    def digest(self, path: str) -> str:
+        # re-hash only when size or mtime moved since the last look
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            cached = self._digests.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = file_digest(path)
+        with self._lock:
+            self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return digest
+
+    def key(self, name: str, inputs: Iterable[str], config: Optional[Dict[str, Any]] = None,
+            version: str = "1") -> str:
+        h = hashlib.sha256()
+        h.update(json.dumps([name, version, config or {}], sort_keys=True, ensure_ascii=False,
+                            default=str).encode("utf-8"))
+        for path in sorted(inputs):
+            h.update(b"\0")
+            h.update(self._relative(path).encode("utf-8"))
+            h.update(b"\0")
+            h.update(self.digest(path).encode("ascii"))
+        return h.hexdigest()
+
+    def lookup(self, key: str) -> Optional[Dict[str, str]]:
+        try:
+            with open(self._manifest_path(key), encoding="utf-8") as f:
+                return json.load(f)["outputs"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def restore(self, outputs: Dict[str, str]) -> bool:
+        """Put missing outputs of a manifest back in place; False if any can not be recovered."""
+        for relative, digest in outputs.items():
+            path = os.path.join(self.root, relative)
+            if os.path.exists(path):
+                continue
+            stored = self._object_path(digest)
+            if not os.path.exists(stored):
+                return False
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(stored, path)
+        return True
+
+    def edited(self, outputs: Dict[str, str]) -> List[str]:
+        """Outputs of a manifest that exist but no longer match what the step produced."""
+        edited = []
+        for relative, digest in outputs.items():
+            path = os.path.join(self.root, relative)
+            if os.path.exists(path) and self.digest(path) != digest:
+                edited.append(path)
+        return edited
+
+    def store(self, key: str, outputs: Iterable[str]) -> Dict[str, str]:
+        recorded = {}
+        for path in outputs:
+            digest = self.digest(path)
+            stored = self._object_path(digest)
+            if not os.path.exists(stored):
+                self._write_atomic(stored, lambda tmp: shutil.copyfile(path, tmp))
+            recorded[self._relative(path)] = digest
+        manifest = json.dumps({"outputs": recorded}, ensure_ascii=False, sort_keys=True)
+        self._write_atomic(self._manifest_path(key), lambda tmp: _write_text(tmp, manifest))
+        return recorded
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, "/")
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, "objects", digest[:2], digest)
+
+    def _manifest_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, "manifests", f"{key}.json")
+
+    def _write_atomic(self, path: str, write):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+
+def _write_text(path: str, text: str):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
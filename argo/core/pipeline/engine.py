@@ -0,0 +1,238 @@
+import asyncio
+import inspect
+import os
+import time
+import uuid
+from enum import Enum
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from argo.core.eventdriver.event_publisher import EventBus, event_bus
+from argo.core.pipeline.artifact_cache import ArtifactCache
+from argo.utils.logger import logger
+
+STEP_STARTED = "pipeline.step.started"
+STEP_CACHED = "pipeline.step.cached"
+STEP_COMPLETED = "pipeline.step.completed"
+STEP_FAILED = "pipeline.step.failed"
+STEP_SKIPPED = "pipeline.step.skipped"
+RUN_COMPLETED = "pipeline.run.completed"
+
+
+class StepStatus(str, Enum):
+    STARTED = "started"
+    CACHED = "cached"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    # a dependency failed, so the step never ran
+    SKIPPED = "skipped"
+
+
+_TOPICS = {
+    StepStatus.STARTED: STEP_STARTED,
+    StepStatus.CACHED: STEP_CACHED,
+    StepStatus.COMPLETED: STEP_COMPLETED,
+    StepStatus.FAILED: STEP_FAILED,
+    StepStatus.SKIPPED: STEP_SKIPPED,
+}
+_SUCCEEDED = (StepStatus.CACHED, StepStatus.COMPLETED)
+
+
+class Step:
+    """
+    One node of a pipeline: ``run(step)`` reads ``inputs`` and writes
+    ``outputs`` (file paths). It may be a plain function, which is run on a
+    worker thread, or a coroutine function. ``after`` names the steps that
+    must finish first; ``config`` and ``version`` are part of the cache key,
+    so changing a prompt template or model setting invalidates the step.
+    """
+
+    def __init__(self, name: str, run: Callable[["Step"], Any], inputs: Iterable[str] = (),
+                 outputs: Iterable[str] = (), after: Iterable[str] = (),
+                 config: Optional[Dict[str, Any]] = None, version: str = "1"):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.after = list(after)
+        self.config = config or {}
+        self.version = version
+
+    def __repr__(self):
+        return f"Step({self.name!r})"
+
+
+class StepEvent:
+    __slots__ = ("run_id", "pipeline", "step", "status", "duration", "error")
+
+    def __init__(self, run_id: str, pipeline: str, step: str, status: StepStatus, duration: float = 0.0,
+                 error: Optional[BaseException] = None):
+        self.run_id = run_id
+        self.pipeline = pipeline
+        self.step = step
+        self.status = status
+        self.duration = duration
+        self.error = error
+
+    def __repr__(self):
+        return f"StepEvent({self.pipeline!r}, {self.step!r}, {self.status.value})"
+
+
+class Pipeline:
+    """
+    Runs a DAG of ``Step`` s, scheduling each one as soon as its
+    dependencies finished. A step whose inputs and config hash to a key the
+    ``ArtifactCache`` already knows is not run again; independent steps run
+    concurrently, at most ``concurrency`` at a time. Scheduling is driven by
+    the ``pipeline.step.*`` events the steps publish on the bus, filtered by
+    a per-run id so concurrent runs sharing a bus stay apart; a failing
+    observer does not affect the run.
+    """
+
+    def __init__(self, name: str, root: str, bus: Optional[EventBus] = None,
+                 cache: Optional[ArtifactCache] = None, concurrency: int = 4):
+        if concurrency <= 0:
+            raise ValueError("concurrency must be positive")
+        self.name = name
+        self.root = root
+        self.bus = bus or event_bus
+        self.cache = cache or ArtifactCache(root)
+        self.concurrency = concurrency
+        self.steps: Dict[str, Step] = {}
+
+    def add(self, step: Step) -> Step:
+        if step.name in self.steps:
+            raise ValueError(f"duplicate step {step.name}")
+        self.steps[step.name] = step
+        return step
+
+    async def run(self, force: Iterable[str] = ()) -> Dict[str, StepStatus]:
+        """Run every step that is out of date; ``force`` names steps to run regardless of the cache."""
+        order = self._validate()
+        run_id = uuid.uuid4().hex
+        force = set(force)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        dependents: Dict[str, List[str]] = {name: [] for name in order}
+        waiting: Dict[str, Set[str]] = {}
+        for name in order:
+            waiting[name] = set(self.steps[name].after)
+            for dependency in self.steps[name].after:
+                dependents[dependency].append(name)
+        statuses: Dict[str, StepStatus] = {}
+        tasks: Set[asyncio.Task] = set()
+        finished = asyncio.Event()
+
+        def launch(name: str):
+            task = asyncio.create_task(self._execute(run_id, self.steps[name], semaphore, name in force))
+            tasks.add(task)
+            task.add_done_callback(settle)
+
+        def settle(task: asyncio.Task):
+            tasks.discard(task)
+            # a failing observer ahead of us on the bus may have kept on_step from seeing the event
+            if not task.cancelled() and task.result().step not in statuses:
+                on_step(task.result())
+
+        def on_step(event: StepEvent):
+            if event.run_id != run_id or event.pipeline != self.name or event.status is StepStatus.STARTED:
+                return
+            if event.step in statuses:
+                return
+            statuses[event.step] = event.status
+            for name in dependents[event.step]:
+                if name in statuses:
+                    continue
+                if event.status not in _SUCCEEDED:
+                    skipped = StepEvent(run_id, self.name, name, StepStatus.SKIPPED)
+                    self._publish(skipped)
+                    if name not in statuses:
+                        on_step(skipped)
+                    continue
+                waiting[name].discard(event.step)
+                if not waiting[name]:
+                    launch(name)
+            if len(statuses) == len(order):
+                finished.set()
+
+        subscription = self.bus.subscribe("pipeline.step.*", on_step)
+        try:
+            for name in order:
+                if not waiting[name]:
+                    launch(name)
+            if order:
+                await finished.wait()
+        finally:
+            subscription.unsubscribe()
+            for task in list(tasks):
+                task.cancel()
+        self._publish_run(RUN_COMPLETED, {"run_id": run_id, "pipeline": self.name, "steps": dict(statuses)})
+        return statuses
+
+    async def _execute(self, run_id: str, step: Step, semaphore: asyncio.Semaphore, force: bool) -> StepEvent:
+        async with semaphore:
+            self._publish(StepEvent(run_id, self.name, step.name, StepStatus.STARTED))
+            start = time.perf_counter()
+            try:
+                # hashing inputs reads files, keep it off the loop
+                key = await asyncio.to_thread(self.cache.key, step.name, step.inputs, step.config, step.version)
+                if not force and await asyncio.to_thread(self._restore, step, key):
+                    logger.info("[Pipeline] %s: step %s is up to date", self.name, step.name)
+                    status = StepStatus.CACHED
+                else:
+                    if inspect.iscoroutinefunction(step.run):
+                        await step.run(step)
+                    else:
+                        await asyncio.to_thread(step.run, step)
+                    missing = [path for path in step.outputs if not os.path.exists(path)]
+                    if missing:
+                        raise FileNotFoundError(f"step {step.name} did not produce {', '.join(missing)}")
+                    await asyncio.to_thread(self.cache.store, key, step.outputs)
+                    status = StepStatus.COMPLETED
+            except Exception as e:
+                logger.exception("[Pipeline] %s: step %s failed", self.name, step.name)
+                event = StepEvent(run_id, self.name, step.name, StepStatus.FAILED, time.perf_counter() - start, e)
+                self._publish(event)
+                return event
+        event = StepEvent(run_id, self.name, step.name, status, time.perf_counter() - start)
+        self._publish(event)
+        return event
+
+    def _restore(self, step: Step, key: str) -> bool:
+        outputs = self.cache.lookup(key)
+        if outputs is None:
+            return False
+        for path in self.cache.edited(outputs):
+            logger.info("[Pipeline] %s: step %s keeps hand-edited %s", self.name, step.name, path)
+        return self.cache.restore(outputs)
+
+    def _publish(self, event: StepEvent):
+        self._publish_run(_TOPICS[event.status], event)
+
+    def _publish_run(self, topic: str, event: Any):
+        # observers must not be able to break the run
+        try:
+            self.bus.publish(topic, event)
+        except Exception:
+            logger.exception("[Pipeline] %s: subscriber to %s failed", self.name, topic)
+
+    def _validate(self) -> List[str]:
+        # Kahn's algorithm: a topological order, or an error naming the cycle's members
+        indegree = {name: 0 for name in self.steps}
+        for step in self.steps.values():
+            for dependency in step.after:
+                if dependency not in self.steps:
+                    raise ValueError(f"step {step.name} depends on unknown step {dependency}")
+                indegree[step.name] += 1
+        ready = [name for name, degree in indegree.items() if degree == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for step in self.steps.values():
+                if name in step.after:
+                    indegree[step.name] -= 1
+                    if indegree[step.name] == 0:
+                        ready.append(step.name)
+        if len(order) != len(self.steps):
+            cycle = sorted(name for name, degree in indegree.items() if degree > 0)
+            raise ValueError(f"pipeline {self.name} has a dependency cycle through {', '.join(cycle)}")
+        return order
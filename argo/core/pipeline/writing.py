@@ -0,0 +1,89 @@
+import glob
+import inspect
+import os
+from typing import Any, Callable, Dict, Optional
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.pipeline.artifact_cache import ArtifactCache
+from argo.core.pipeline.engine import Pipeline, Step
+
+IMAGES_DIR = "xhs-images"
+PROMPTS_DIR = os.path.join(IMAGES_DIR, "prompts")
+
+
+def article_paths(draft: str) -> Dict[str, str]:
+    """``post.md`` -> ``post-polished.md`` and ``post-final.md`` next to it, as in recipe/Writter."""
+    stem, ext = os.path.splitext(draft)
+    return {"draft": draft, "polished": f"{stem}-polished{ext}", "final": f"{stem}-final{ext}"}
+
+
+def writing_pipeline(draft: str,
+                     polish: Callable[[str, str], Any],
+                     render_image: Callable[[str, str], Any],
+                     assemble: Callable[[str, Dict[str, str], str], Any],
+                     bus: Optional[EventBus] = None,
+                     cache: Optional[ArtifactCache] = None,
+                     concurrency: int = 4,
+                     config: Optional[Dict[str, Dict[str, Any]]] = None) -> Pipeline:
+    """
+    The recipe/Writter/writing_pipeline.md flow for one article directory:
+
+    - ``polish``: ``polish(draft, polished)`` writes ``*-polished.md``
+    - ``image:<name>``: ``render_image(prompt, png)`` for every
+      ``xhs-images/prompts/<name>.md``, writing ``xhs-images/<name>.png``;
+      these are independent of each other and of polishing
+    - ``final``: ``assemble(polished, {name: png}, final)`` writes ``*-final.md``
+
+    The callables may be coroutine functions. ``config`` holds per-step
+    settings keyed by ``polish``, ``image`` and ``final`` (model, style, ...)
+    that go into the cache key. Adding a prompt adds one image step, so a
+    re-run renders just that image and re-assembles the final article.
+    """
+    config = config or {}
+    paths = article_paths(draft)
+    root = os.path.dirname(os.path.abspath(draft))
+    pipeline = Pipeline(os.path.basename(root), root, bus=bus, cache=cache, concurrency=concurrency)
+
+    pipeline.add(Step(
+        "polish",
+        _call(polish, paths["draft"], paths["polished"]),
+        inputs=[paths["draft"]],
+        outputs=[paths["polished"]],
+        config=config.get("polish"),
+    ))
+
+    images: Dict[str, str] = {}
+    for prompt in sorted(glob.glob(os.path.join(root, PROMPTS_DIR, "*.md"))):
+        name = os.path.splitext(os.path.basename(prompt))[0]
+        image = os.path.join(root, IMAGES_DIR, f"{name}.png")
+        images[name] = image
+        pipeline.add(Step(
+            f"image:{name}",
+            _call(render_image, prompt, image),
+            inputs=[prompt],
+            outputs=[image],
+            config=config.get("image"),
+        ))
+
+    pipeline.add(Step(
+        "final",
+        _call(assemble, paths["polished"], images, paths["final"]),
+        inputs=[paths["polished"], *images.values()],
+        outputs=[paths["final"]],
+        after=["polish", *(f"image:{name}" for name in images)],
+        config=config.get("final"),
+    ))
+    return pipeline
+
+
+def _call(function: Callable[..., Any], *args: Any) -> Callable[[Step], Any]:
+    # keep coroutine functions recognisable so the engine awaits them on the loop
+    if inspect.iscoroutinefunction(function):
+        async def run_async(step: Step):
+            return await function(*args)
+        return run_async
+
+    def run(step: Step):
+        return function(*args)
+    return run
+
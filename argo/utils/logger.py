@@ -1,37 +1,271 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
-def setup_logger(name='logger'):
-    log_dir = 'logs'
-    if not os.path.exists(log_dir):
-        os.makedirs(log_dir)
-    
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class LazyRotatingFileHandler(logging.Handler):
+    """
+    Creates the log directory and opens the file on the first record, not at
+    import. If that fails (read-only directory, ``log_dir`` is a file, ...)
+    the error is reported once and later records only reach the console.
+    """
+
+    def __init__(self, log_dir: str = 'logs', max_bytes: int = 10*1024*1024, backup_count: int = 5):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handler: Optional[RotatingFileHandler] = None
+        self._failed = False
+
+    def emit(self, record: logging.LogRecord):
+        if self._handler is None:
+            if self._failed:
+                return
+            try:
+                os.makedirs(self.log_dir, exist_ok=True)
+                log_file = os.path.join(self.log_dir, f'{datetime.now().strftime("%Y-%m-%d")}.log')
+                self._handler = RotatingFileHandler(
+                    log_file,
+                    maxBytes=self.max_bytes,
+                    backupCount=self.backup_count,
+                    encoding='utf-8'
+                )
+            except OSError:
+                self._failed = True
+                self.handleError(record)
+                return
+            self._handler.setFormatter(self.formatter)
+        self._handler.emit(record)
+
+    def flush(self):
+        if self._handler is not None:
+            self._handler.flush()
+
+    def close(self):
+        if self._handler is not None:
+            self._handler.close()
+        super().close()
+
+
+class _Listener(QueueListener):
+    @property
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def handle(self, record: logging.LogRecord):
+        # a handler that raises must not take the listener thread, and with
+        # it every later record, down
+        try:
+            super().handle(record)
+        except Exception:
+            if logging.raiseExceptions:
+                sys.stderr.write('--- Logging error in listener ---\n')
+                logging.Handler.handleError(self.handlers[0], record)
+
+    def stop(self, timeout: float = 5.0):
+        # the stock stop uses put_nowait, which fails on a full queue, and then
+        # joins without a limit; wait for room and for the thread, but only so
+        # long, and not at all for a thread that is already gone
+        thread = self._thread
+        if thread is None:
+            return
+        if thread.is_alive():
+            try:
+                self.queue.put(self._sentinel, timeout=timeout)
+            except queue.Full:
+                pass
+            thread.join(timeout)
+        self._thread = None
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    Hands records to a background listener through a bounded queue.
+
+    The caller only builds the record and enqueues it: message formatting,
+    console and file writes all happen on the listener thread, which is
+    started with the first record. When the queue is full the record is
+    dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, handlers: List[logging.Handler], maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.targets = handlers
+        self.dropped = 0
+        self._listener: Optional[QueueListener] = None
+        self._start_lock = threading.Lock()
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # the queue is thread-safe already, so skip Handler.handle's lock
+        if self.filter(record):
+            self.emit(record)
+            return True
+        return False
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # records stay in-process, so skip QueueHandler's eager formatting;
+        # mutable args are rendered later and may reflect later changes
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self._listener is None:
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self):
+        with self._start_lock:
+            if self._listener is None:
+                listener = _Listener(self.queue, *self.targets, respect_handler_level=True)
+                listener.start()
+                self._listener = listener
+                atexit.register(self.stop)
+
+    def flush(self, timeout: float = 5.0):
+        """Block until every queued record has been written, or ``timeout`` seconds have passed."""
+        listener = self._listener
+        if listener is None:
+            return
+        deadline = time.monotonic() + timeout
+        done = self.queue.all_tasks_done
+        with done:
+            # wake up now and then so a dead listener can't keep us here
+            while self.queue.unfinished_tasks and listener.alive:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done.wait(min(remaining, 0.1))
+        for handler in self.targets:
+            handler.flush()
+
+    def stop(self):
+        with self._start_lock:
+            listener, self._listener = self._listener, None
+        if listener is not None:
+            # QueueListener.stop drains what is already queued before returning
+            listener.stop()
+            for handler in self.targets:
+                try:
+                    handler.flush()
+                except (OSError, ValueError):
+                    # the stream may already be closed when this runs at exit,
+                    # logging.shutdown ignores the same errors
+                    pass
+
+    def close(self):
+        self.stop()
+        for handler in self.targets:
+            handler.close()
+        super().close()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per message template: lets ``rate`` records per ``per``
+    seconds through (with bursts up to ``burst``) and drops the rest before
+    they reach the queue. The next record let through for a template reports
+    how many of its siblings were suppressed.
+    """
+
+    def __init__(self, rate: float, per: float = 1.0, burst: Optional[int] = None):
+        super().__init__()
+        self.rate = rate / per
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self._buckets: Dict[Tuple[str, str], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                # [tokens, last refill, suppressed]
+                bucket = self._buckets[key] = [float(self.burst), now, 0]
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                bucket[2] += 1
+                return False
+            bucket[0] = tokens - 1
+            suppressed, bucket[2] = int(bucket[2]), 0
+        if suppressed:
+            record.msg = f"{record.msg} (suppressed {suppressed} similar)"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets one record out of every ``every`` through."""
+
+    def __init__(self, every: int):
+        super().__init__()
+        if every <= 0:
+            raise ValueError("every must be positive")
+        self.every = every
+        self._count = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        self._count += 1
+        return (self._count - 1) % self.every == 0
+
+
+def setup_logger(name='logger', log_dir='logs', queue_size=10000):
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    
+
     if logger.handlers:
         return logger
-    
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    
+
+    formatter = logging.Formatter(FORMAT)
+
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    log_file = os.path.join(log_dir, f'{datetime.now().strftime("%Y-%m-%d")}.log')
-    file_handler = RotatingFileHandler(
-        log_file,
-        maxBytes=10*1024*1024,  # 10MB
-        backupCount=5,
-        encoding='utf-8'
-    )
+
+    file_handler = LazyRotatingFileHandler(log_dir)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
+
+    logger.addHandler(BoundedQueueHandler([console_handler, file_handler], maxsize=queue_size))
+
     return logger
 
-logger = setup_logger() 
+
+def get_limited_logger(name: str, rate: Optional[float] = None, sample_every: Optional[int] = None,
+                       parent: Optional[logging.Logger] = None) -> logging.Logger:
+    """
+    Child of ``parent`` (the default ``logger``) for high-frequency events,
+    rate limited to ``rate`` records per second and/or sampled one in
+    ``sample_every``. Records still go out through the parent's queue.
+    """
+    child = (parent or logger).getChild(name)
+    if not child.filters:
+        if rate is not None:
+            child.addFilter(RateLimitFilter(rate))
+        if sample_every is not None:
+            child.addFilter(SamplingFilter(sample_every))
+    return child
+
+
+def flush_logs(target: Optional[logging.Logger] = None):
+    for handler in (target or logger).handlers:
+        handler.flush()
+
+
+def shutdown_logging(target: Optional[logging.Logger] = None):
+    for handler in (target or logger).handlers:
+        if isinstance(handler, BoundedQueueHandler):
+            handler.stop()
+
+logger = setup_logger()
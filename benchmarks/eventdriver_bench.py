@@ -0,0 +1,340 @@
+"""
+Benchmarks for argo.core.eventdriver and argo.utils.logger.
+
+Run from the repository root:
+
+    python -m benchmarks.eventdriver_bench --output bench.json
+    python -m benchmarks.eventdriver_bench --baseline bench.json --fail-on-regression
+
+Every scenario reports publish throughput; scenarios whose handlers record
+arrival times also report end-to-end latency percentiles, and the memory
+scenarios report per event the tracemalloc peak bytes, the blocks held by
+events in flight and the blocks still retained once everything finished.
+With ``--baseline`` each metric is compared against the stored run and
+changes beyond ``--tolerance`` are flagged.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.eventdriver.metrics import LatencyHistogram
+from argo.utils.logger import BoundedQueueHandler, logger
+
+# metric name -> True when larger is better; max_us and
+# retained_blocks_per_event (close to zero unless something leaks) are
+# reported but too noisy to compare as ratios
+METRICS = {
+    "events_per_s": True,
+    "deliveries_per_s": True,
+    "p50_us": False,
+    "p99_us": False,
+    "peak_bytes_per_event": False,
+    "alloc_blocks_per_event": False,
+    "ns_per_call": False,
+}
+
+
+class _Recorder:
+    """Handlers stamp arrival latency into one histogram shared by the scenario."""
+
+    def __init__(self):
+        self.histogram = LatencyHistogram()
+        self.deliveries = 0
+
+    def sync_handler(self, event: Tuple[int, int]):
+        self.deliveries += 1
+        self.histogram.record(time.perf_counter_ns() - event[0])
+
+    async def async_handler(self, event: Tuple[int, int]):
+        self.deliveries += 1
+        self.histogram.record(time.perf_counter_ns() - event[0])
+
+
+def _subscribe(bus: EventBus, topic: str, recorder: _Recorder, fanout: int, kind: str):
+    for i in range(fanout):
+        if kind == "sync" or (kind == "mixed" and i % 2 == 0):
+            # distinct callables, the bus would otherwise treat them as one
+            bus.subscribe(topic, lambda e, h=recorder.sync_handler: h(e))
+        else:
+            async def handler(e, h=recorder.async_handler):
+                await h(e)
+            bus.subscribe(topic, handler)
+
+
+def _result(events: int, elapsed: float, recorder: Optional[_Recorder] = None) -> Dict[str, Any]:
+    result = {"events": events, "events_per_s": events / elapsed}
+    if recorder is not None and recorder.histogram.total:
+        h = recorder.histogram
+        result.update({
+            "deliveries_per_s": recorder.deliveries / elapsed,
+            "p50_us": h.percentile(50) / 1000,
+            "p99_us": h.percentile(99) / 1000,
+            "max_us": h.max / 1000,
+        })
+    return result
+
+
+def fanout_scenario(fanout: int, kind: str, events: int, burst: int = 1) -> Callable[[], Dict[str, Any]]:
+    """
+    ``burst == 1`` is steady load: the loop gets a turn after every publish.
+    Larger bursts publish that many events back to back before yielding.
+    """
+    def run() -> Dict[str, Any]:
+        bus = EventBus()
+        recorder = _Recorder()
+        _subscribe(bus, "bench.topic", recorder, fanout, kind)
+
+        async def drive():
+            start = time.perf_counter()
+            for i in range(0, events, burst):
+                for j in range(i, min(i + burst, events)):
+                    bus.publish("bench.topic", (time.perf_counter_ns(), j))
+                await asyncio.sleep(0)
+            await bus.drain()
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(drive())
+        return _result(events, elapsed, recorder)
+    return run
+
+
+def topics_scenario(topics: int, events: int, wildcard: bool = False) -> Callable[[], Dict[str, Any]]:
+    """Events spread round-robin over ``topics`` topics, one sync subscriber each."""
+    def run() -> Dict[str, Any]:
+        bus = EventBus()
+        recorder = _Recorder()
+        names = [f"bench.t{i}.done" for i in range(topics)]
+        if wildcard:
+            bus.subscribe("bench.*.done", recorder.sync_handler)
+        else:
+            for name in names:
+                bus.subscribe(name, recorder.sync_handler)
+        start = time.perf_counter()
+        for i in range(events):
+            bus.publish(names[i % topics], (time.perf_counter_ns(), i))
+        return _result(events, time.perf_counter() - start, recorder)
+    return run
+
+
+def publish_many_scenario(fanout: int, events: int, batch: int) -> Callable[[], Dict[str, Any]]:
+    def run() -> Dict[str, Any]:
+        bus = EventBus()
+        recorder = _Recorder()
+        _subscribe(bus, "bench.topic", recorder, fanout, "sync")
+        start = time.perf_counter()
+        for i in range(0, events, batch):
+            now = time.perf_counter_ns()
+            bus.publish_many("bench.topic", [(now, j) for j in range(i, min(i + batch, events))])
+        return _result(events, time.perf_counter() - start, recorder)
+    return run
+
+
+def memory_scenario(fanout: int, kind: str, events: int) -> Callable[[], Dict[str, Any]]:
+    """
+    ``alloc_blocks_per_event`` counts the blocks the publishes allocated that
+    are still alive when the publish loop ends, before anything was drained:
+    what each event in flight costs (tasks, coroutines, queue entries).
+    ``retained_blocks_per_event`` is the net change once the loop has shut
+    down and everything was collected, which only grows when something leaks.
+    """
+    def run() -> Dict[str, Any]:
+        bus = EventBus()
+        _subscribe(bus, "bench.topic", _Recorder(), fanout, kind)
+
+        async def drive():
+            # warm the route cache so it is not charged to the events
+            bus.publish("bench.topic", (0, 0))
+            await bus.drain()
+            await asyncio.sleep(0)
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            for i in range(events):
+                bus.publish("bench.topic", (0, i))
+            in_flight = tracemalloc.take_snapshot()
+            await bus.drain()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            allocated = sum(stat.count_diff for stat in in_flight.compare_to(before, "filename")
+                            if stat.count_diff > 0)
+            return peak - base, allocated
+
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        # done callbacks of drained tasks only run on the loop's next turns,
+        # so retained blocks are counted once asyncio.run has closed the loop
+        peak, allocated = asyncio.run(drive())
+        gc.collect()
+        retained = sys.getallocatedblocks() - blocks
+        return {
+            "events": events,
+            "peak_bytes_per_event": peak / events,
+            "alloc_blocks_per_event": allocated / events,
+            "retained_blocks_per_event": retained / events,
+        }
+    return run
+
+
+def logger_scenario(calls: int, enabled: bool) -> Callable[[], Dict[str, Any]]:
+    """Caller-side cost of one log call through the queue pipeline, writing to nowhere."""
+    def run() -> Dict[str, Any]:
+        bench_logger = logging.getLogger("argo.bench")
+        bench_logger.propagate = False
+        bench_logger.setLevel(logging.INFO if enabled else logging.WARNING)
+        handler = BoundedQueueHandler([logging.NullHandler()], maxsize=calls + 1)
+        bench_logger.addHandler(handler)
+        try:
+            start = time.perf_counter_ns()
+            for i in range(calls):
+                bench_logger.info("[Event] publishing event %s", i)
+            elapsed = time.perf_counter_ns() - start
+        finally:
+            bench_logger.removeHandler(handler)
+            handler.close()
+        return {"events": calls, "ns_per_call": elapsed / calls}
+    return run
+
+
+def scenarios(scale: float) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    def n(count: int) -> int:
+        return max(1, int(count * scale))
+
+    suite: Dict[str, Callable[[], Dict[str, Any]]] = {}
+    for fanout, events in ((1, 50000), (10, 20000), (1000, 200)):
+        for kind in ("sync", "async", "mixed"):
+            suite[f"fanout{fanout}_{kind}_steady"] = fanout_scenario(fanout, kind, n(events))
+            suite[f"fanout{fanout}_{kind}_bursty"] = fanout_scenario(fanout, kind, n(events), burst=500)
+    suite["topics_one_hot"] = topics_scenario(1, n(100000))
+    suite["topics_many_1000"] = topics_scenario(1000, n(100000))
+    suite["topics_wildcard_1000"] = topics_scenario(1000, n(100000), wildcard=True)
+    suite["publish_many_fanout10"] = publish_many_scenario(10, n(20000), 100)
+    for kind in ("sync", "async"):
+        suite[f"memory_fanout10_{kind}"] = memory_scenario(10, kind, n(5000))
+    suite["logger_enabled"] = logger_scenario(n(50000), True)
+    suite["logger_disabled"] = logger_scenario(n(200000), False)
+    return suite
+
+
+def _best(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    # best of the repeats per metric, which is the least noisy estimate
+    best = dict(runs[0])
+    for run in runs[1:]:
+        for name, value in run.items():
+            if name in METRICS:
+                better = max if METRICS[name] else min
+                best[name] = better(best[name], value)
+    return best
+
+
+def run_suite(scale: float = 1.0, repeat: int = 3, only: Optional[str] = None) -> Dict[str, Any]:
+    level = logger.level
+    # the bus logs every publish to async subscribers; keep that off the numbers
+    logger.setLevel(logging.WARNING)
+    results = {}
+    try:
+        for name, scenario in scenarios(scale).items():
+            if only and only not in name:
+                continue
+            results[name] = _best([scenario() for _ in range(repeat)])
+            print(f"{name:32s} {_summary(results[name])}", file=sys.stderr)
+    finally:
+        logger.setLevel(level)
+    return {"meta": _meta(scale, repeat), "results": results}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    changes = []
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result or not base.get(metric):
+                continue
+            ratio = result[metric] / base[metric]
+            change = ratio - 1 if higher_is_better else 1 - ratio
+            status = "ok"
+            if change < -tolerance:
+                status = "regression"
+            elif change > tolerance:
+                status = "improvement"
+            changes.append({
+                "scenario": name,
+                "metric": metric,
+                "baseline": base[metric],
+                "current": result[metric],
+                "change": change,
+                "status": status,
+            })
+    return changes
+
+
+def _summary(result: Dict[str, Any]) -> str:
+    return "  ".join(f"{k}={v:,.2f}" for k, v in result.items() if k != "events")
+
+
+def _meta(scale: float, repeat: int) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "commit": commit,
+        "scale": scale,
+        "repeat": repeat,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", "-o", help="write results as JSON to this path")
+    parser.add_argument("--baseline", "-b", help="compare against results stored at this path")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative change treated as noise when comparing (default 0.10)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="exit with status 1 if any metric regressed beyond the tolerance")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every scenario's event count")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario, the best is kept")
+    parser.add_argument("--only", help="run only scenarios whose name contains this string")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.scale, args.repeat, args.only)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        report["comparison"] = compare(report, baseline, args.tolerance)
+        for change in report["comparison"]:
+            if change["status"] != "ok":
+                print(f"{change['status']:12s} {change['scenario']}.{change['metric']}: "
+                      f"{change['baseline']:,.2f} -> {change['current']:,.2f} ({change['change']:+.1%})",
+                      file=sys.stderr)
+        regressions = [c for c in report["comparison"] if c["status"] == "regression"]
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,14 @@
+import pytest
+
+from argo.utils.logger import LazyRotatingFileHandler, logger
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _log_to_tmp(tmp_path_factory):
+    # keep the suite from creating logs/ in the working directory
+    log_dir = str(tmp_path_factory.mktemp("logs"))
+    for handler in logger.handlers:
+        for target in getattr(handler, "targets", ()):
+            if isinstance(target, LazyRotatingFileHandler):
+                target.log_dir = log_dir
+    yield
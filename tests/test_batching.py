@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from argo.core.eventdriver.batching import Batcher
+from argo.core.eventdriver.event_publisher import EventBus
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.005)
+
+
+def test_batch_size():
+    batches = []
+    batcher = Batcher(batches.append, batch_size=3)
+    batcher.add_many(range(7))
+    assert batches == [[0, 1, 2], [3, 4, 5]]
+    assert len(batcher) == 1
+    batcher.flush()
+    assert batches[-1] == [6]
+
+
+def test_coalescing_keeps_the_latest_event_per_key():
+    batches = []
+    batcher = Batcher(batches.append, batch_size=100, coalesce_key=lambda event: event["id"])
+    for n in range(6):
+        batcher.add({"id": n % 2, "n": n})
+    batcher.flush()
+    assert batches == [[{"id": 0, "n": 4}, {"id": 1, "n": 5}]]
+    assert batcher.coalesced == 4
+
+
+def test_latency_timer_without_a_loop():
+    batches = []
+    batcher = Batcher(batches.append, max_latency_ms=20)
+    batcher.add(1)
+    batcher.add(2)
+    assert batches == []
+    _wait_for(lambda: batches)
+    assert batches == [[1, 2]]
+    assert threading.current_thread() is threading.main_thread()
+
+
+def test_latency_timer_on_the_loop():
+    batches = []
+
+    async def main():
+        batcher = Batcher(batches.append, max_latency_ms=10)
+        batcher.add(1)
+        await asyncio.sleep(0.05)
+
+    asyncio.run(main())
+    assert batches == [[1]]
+
+
+def test_timer_of_a_finished_loop_does_not_block_a_new_one():
+    batches = []
+    batcher = Batcher(batches.append, max_latency_ms=10)
+
+    async def main():
+        batcher.add(1)
+
+    # the loop closes before its timer fires
+    asyncio.run(main())
+    batcher.add(2)
+    _wait_for(lambda: batches)
+    assert batches == [[1, 2]]
+
+
+def test_close_delivers_what_is_buffered():
+    batches = []
+    batcher = Batcher(batches.append, max_latency_ms=10000)
+    batcher.add(1)
+    batcher.close()
+    assert batches == [[1]]
+
+
+@pytest.mark.parametrize("kwargs", [{}, {"batch_size": 0}, {"max_latency_ms": -1}])
+def test_invalid_settings(kwargs):
+    with pytest.raises(ValueError):
+        Batcher(print, **kwargs)
+
+
+def test_bus_publish_many_feeds_batching_subscribers():
+    bus = EventBus()
+    batches = []
+    bus.subscribe("metric.*", batches.append, batch_size=4)
+    bus.publish_many("metric.tick", range(10))
+    bus.flush()
+    assert batches == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
+
+
+def test_async_batch_armed_off_the_loop_is_delivered_on_it():
+    batches = []
+
+    async def handler(batch):
+        batches.append((batch, threading.current_thread() is threading.main_thread()))
+
+    async def main():
+        bus = EventBus()
+        bus.subscribe("metric.*", handler, max_latency_ms=20)
+        # the loop is known from an earlier publish on it
+        bus.publish("metric.tick", 0)
+        await asyncio.sleep(0.05)
+        # published from a thread, so the timer is a threading.Timer
+        await asyncio.to_thread(bus.publish, "metric.tick", 1)
+        await asyncio.sleep(0.1)
+        await bus.drain()
+
+    asyncio.run(main())
+    assert batches == [([0], True), ([1], True)]
@@ -0,0 +1,65 @@
+import enum
+import math
+from array import array
+from collections import namedtuple
+
+import pytest
+
+from argo.core.eventdriver import codec
+
+Point = namedtuple("Point", "x y")
+
+
+class Color(enum.Enum):
+    RED = 1
+
+
+@pytest.mark.parametrize("value", [
+    None, True, False, 0, 1, -1, 63, -64, 2 ** 63 - 1, -2 ** 63, 2 ** 63, -2 ** 200, 3.5, -0.0,
+    float("inf"), "", "markdown ✍️", b"", b"\x00\xff" * 1000, bytearray(b"ab"),
+    [], [1, [2, [3]]], (), (1, "a", None), {}, {"a": 1, 2: [b"x"], (1, 2): {"nested": True}},
+])
+def test_round_trip(value):
+    decoded = codec.decode(codec.encode(value))
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+def test_nan_round_trips():
+    assert math.isnan(codec.decode(codec.encode(float("nan"))))
+
+
+def test_subclasses_keep_their_type():
+    assert codec.decode(codec.encode(Point(1, 2))) == Point(1, 2)
+    assert type(codec.decode(codec.encode(Point(1, 2)))) is Point
+    assert codec.decode(codec.encode(Color.RED)) is Color.RED
+    assert codec.decode(codec.encode(True)) is True
+
+
+def test_small_ints_are_compact():
+    assert len(codec.encode(5)) == 2
+    assert len(codec.encode(-5)) == 2
+
+
+def test_trailing_bytes_are_rejected():
+    with pytest.raises(ValueError):
+        codec.decode(codec.encode(1) + b"\x00")
+
+
+def test_unknown_tag_is_rejected():
+    with pytest.raises(ValueError):
+        codec.decode(b"\xee")
+
+
+def test_memoryview_is_sent_as_its_bytes():
+    numbers = array("i", [1, 2, 3])
+    assert codec.decode(codec.encode(memoryview(numbers))) == numbers.tobytes()
+    assert codec.decode(codec.encode([memoryview(numbers), 7])) == [numbers.tobytes(), 7]
+
+
+@pytest.mark.parametrize("value", [1 << 40, 3.5, "markdown", b"abc", [1, 2, 3], {"a": 1}, Point(1, 2)])
+def test_truncated_input_is_rejected(value):
+    data = codec.encode(value)
+    for end in range(len(data)):
+        with pytest.raises(ValueError):
+            codec.decode(data[:end])
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+
+from argo.core.eventdriver.dispatch_queue import OverflowPolicy, QueuedDispatcher, QueueFullError
+from argo.core.eventdriver.event_publisher import EventBus
+
+
+def test_keyed_events_keep_publish_order():
+    seen = {}
+
+    async def handler(event):
+        key, n = event
+        # later events of other keys may overtake, events of one key may not
+        await asyncio.sleep(0.001 * (n % 3))
+        seen.setdefault(key, []).append(n)
+
+    async def main():
+        bus = EventBus()
+        bus.subscribe("job.*", handler, queued=True, workers=4, key=lambda event: event[0])
+        for n in range(30):
+            for key in "abcde":
+                bus.publish("job.run", (key, n))
+        await bus.drain()
+
+    asyncio.run(main())
+    assert seen == {key: list(range(30)) for key in "abcde"}
+
+
+def test_workers_share_one_queue_without_key():
+    active = []
+    peak = []
+
+    async def handler(event):
+        active.append(event)
+        peak.append(len(active))
+        await asyncio.sleep(0.01)
+        active.remove(event)
+
+    async def main():
+        dispatcher = QueuedDispatcher(handler, workers=3)
+        for n in range(9):
+            dispatcher.offer(n)
+        await dispatcher.drain()
+        await dispatcher.aclose()
+
+    asyncio.run(main())
+    assert max(peak) == 3
+
+
+def _blocked(overflow, maxsize=2):
+    # the handler never gets to run: offers happen before the loop yields
+    seen = []
+    dispatcher = QueuedDispatcher(seen.append, maxsize=maxsize, overflow=overflow)
+    return dispatcher, seen
+
+
+def test_drop_new():
+    async def main():
+        dispatcher, seen = _blocked(OverflowPolicy.DROP_NEW)
+        assert [dispatcher.offer(n) for n in range(4)] == [True, True, False, False]
+        await dispatcher.drain()
+        return dispatcher, seen
+
+    dispatcher, seen = asyncio.run(main())
+    assert seen == [0, 1]
+    assert dispatcher.dropped == 2
+
+
+def test_drop_oldest():
+    async def main():
+        dispatcher, seen = _blocked(OverflowPolicy.DROP_OLDEST)
+        assert [dispatcher.offer(n) for n in range(4)] == [True, True, False, False]
+        await dispatcher.drain()
+        return dispatcher, seen
+
+    dispatcher, seen = asyncio.run(main())
+    assert seen == [2, 3]
+    assert dispatcher.dropped == 2
+
+
+def test_raise():
+    async def main():
+        dispatcher, seen = _blocked(OverflowPolicy.RAISE)
+        dispatcher.offer(0)
+        dispatcher.offer(1)
+        with pytest.raises(QueueFullError):
+            dispatcher.offer(2)
+        await dispatcher.drain()
+        return seen
+
+    assert asyncio.run(main()) == [0, 1]
+
+
+def test_try_publish_reports_drops_and_publish_async_waits():
+    async def main():
+        bus = EventBus()
+        seen = []
+        bus.subscribe("job.*", seen.append, queued=True, maxsize=1)
+        assert bus.try_publish("job.run", 0) is True
+        assert bus.try_publish("job.run", 1) is False
+        await bus.drain()
+        for n in range(2, 6):
+            # backpressure: waits for room instead of dropping
+            await bus.publish_async("job.run", n)
+        await bus.drain()
+        return seen
+
+    assert asyncio.run(main()) == [0, 2, 3, 4, 5]
+
+
+def test_failing_handler_does_not_stop_the_worker():
+    seen = []
+
+    def handler(event):
+        if event == 1:
+            raise RuntimeError("boom")
+        seen.append(event)
+
+    async def main():
+        dispatcher = QueuedDispatcher(handler)
+        for n in range(3):
+            dispatcher.offer(n)
+        await dispatcher.drain()
+        await dispatcher.aclose()
+
+    asyncio.run(main())
+    assert seen == [0, 2]
+
+
+def test_offer_outside_a_loop_fails():
+    with pytest.raises(RuntimeError):
+        QueuedDispatcher(print).offer(1)
+
+
+def test_publish_outside_a_loop_is_logged_and_reported(caplog):
+    bus = EventBus()
+    bus.subscribe("job.*", print, queued=True)
+    with caplog.at_level("ERROR", logger="logger"):
+        assert bus.try_publish("job.run", 1) is False
+    assert "can not handle event job.run" in caplog.text
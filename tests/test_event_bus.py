@@ -0,0 +1,82 @@
+import asyncio
+
+from argo.core.eventdriver.event_publisher import EventBus
+
+
+def test_sync_subscribers_run_in_subscription_order():
+    bus = EventBus()
+    seen = []
+    bus.subscribe("article.*", lambda event: seen.append(("pattern", event)))
+    bus.subscribe("article.saved", lambda event: seen.append(("exact", event)))
+    bus.subscribe("#", lambda event: seen.append(("all", event)))
+    bus.publish("article.saved", 1)
+    assert seen == [("pattern", 1), ("exact", 1), ("all", 1)]
+
+
+def test_route_cache_follows_subscribe_and_unsubscribe():
+    bus = EventBus()
+    seen = []
+    bus.publish("article.saved", 0)
+    first = bus.subscribe("article.*", seen.append)
+    bus.publish("article.saved", 1)
+    second = bus.subscribe("article.saved", seen.append)
+    bus.publish("article.saved", 2)
+    first.unsubscribe()
+    bus.publish("article.saved", 3)
+    second.unsubscribe()
+    bus.publish("article.saved", 4)
+    assert seen == [1, 2, 2, 3]
+
+
+def test_route_cache_is_bounded():
+    bus = EventBus(route_cache_size=4)
+    seen = []
+    bus.subscribe("t.*", seen.append)
+    for n in range(20):
+        bus.publish(f"t.{n}", n)
+    assert seen == list(range(20))
+    assert len(bus._routes) <= 4
+
+
+def test_subscription_handle():
+    bus = EventBus()
+    seen = []
+    subscription = bus.subscribe("article.saved", seen.append)
+    assert subscription.active
+    subscription.unsubscribe()
+    subscription.unsubscribe()
+    assert not subscription.active
+    bus.publish("article.saved", 1)
+    assert seen == []
+
+
+def test_unsubscribe_by_callback_removes_the_earliest_registration():
+    bus = EventBus()
+    seen = []
+    bus.subscribe("article.saved", seen.append)
+    bus.subscribe("article.saved", seen.append)
+    bus.unsubscribe("article.saved", seen.append)
+    bus.publish("article.saved", 1)
+    assert seen == [1]
+    bus.unsubscribe("article.saved", seen.append)
+    bus.unsubscribe("article.saved", seen.append)
+    bus.publish("article.saved", 2)
+    assert seen == [1]
+
+
+def test_async_subscribers_run_as_tasks():
+    seen = []
+
+    async def handler(event):
+        seen.append(event)
+
+    async def main():
+        bus = EventBus()
+        bus.subscribe("article.*", handler)
+        bus.publish("article.saved", 1)
+        assert seen == []
+        await bus.drain()
+        assert bus.in_flight == 0
+
+    asyncio.run(main())
+    assert seen == [1]
@@ -0,0 +1,90 @@
+import threading
+import time
+from concurrent.futures import CancelledError, wait
+
+import pytest
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.eventdriver.executors import ExecutorKind, ExecutorPools, OffloadedHandler
+
+
+@pytest.fixture
+def pools():
+    pools = ExecutorPools(thread_workers=8)
+    yield pools
+    pools.shutdown()
+
+
+def test_backlog_caps_concurrency(pools):
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def handler(event):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return event * 2
+
+    handler_ = OffloadedHandler(handler, pools, ExecutorKind.THREAD, max_concurrency=2)
+    futures = [handler_.submit(n) for n in range(8)]
+    assert handler_.backlog == 6
+    wait(futures, timeout=5)
+    assert [future.result() for future in futures] == [n * 2 for n in range(8)]
+    assert peak[0] == 2
+    assert handler_.backlog == 0
+
+
+def test_errors_reach_the_future_and_free_the_slot(pools):
+    def handler(event):
+        if event == 0:
+            raise ValueError("bad event")
+        return event
+
+    handler_ = OffloadedHandler(handler, pools, ExecutorKind.THREAD, max_concurrency=1)
+    futures = [handler_.submit(n) for n in range(3)]
+    wait(futures, timeout=5)
+    with pytest.raises(ValueError):
+        futures[0].result()
+    assert [future.result() for future in futures[1:]] == [1, 2]
+
+
+def test_cancelled_backlog_entry_is_skipped(pools):
+    release = threading.Event()
+    seen = []
+
+    def handler(event):
+        release.wait(5)
+        seen.append(event)
+
+    handler_ = OffloadedHandler(handler, pools, ExecutorKind.THREAD, max_concurrency=1)
+    futures = [handler_.submit(n) for n in range(3)]
+    assert futures[1].cancel()
+    release.set()
+    wait([futures[0], futures[2]], timeout=5)
+    assert seen == [0, 2]
+    with pytest.raises(CancelledError):
+        futures[1].result()
+    assert handler_.backlog == 0
+
+
+def test_async_handlers_can_not_be_offloaded(pools):
+    async def handler(event):
+        pass
+
+    with pytest.raises(ValueError):
+        OffloadedHandler(handler, pools, ExecutorKind.THREAD)
+
+
+def test_publish_returns_futures_of_offloaded_subscribers():
+    bus = EventBus(thread_workers=2)
+    try:
+        bus.subscribe("image.render", lambda event: event + 1, executor="thread", max_concurrency=1)
+        futures = [future for n in range(4) for future in bus.publish("image.render", n)]
+        wait(futures, timeout=5)
+        assert [future.result() for future in futures] == [1, 2, 3, 4]
+    finally:
+        bus.executors.shutdown()
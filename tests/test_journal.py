@@ -0,0 +1,212 @@
+import asyncio
+import glob
+import os
+
+import pytest
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.eventdriver.journal import Journal
+
+
+def _journal(directory, **kwargs):
+    kwargs.setdefault("fsync", False)
+    kwargs.setdefault("commit_interval_ms", 0)
+    return Journal(str(directory), **kwargs)
+
+
+def _fill(journal, count, topic="article.saved", key=None):
+    for i in range(count):
+        journal.append(topic, {"id": i if key is None else key(i), "n": i})
+    journal.sync()
+
+
+def _segments(directory):
+    return sorted(glob.glob(os.path.join(str(directory), "*.log")))
+
+
+def test_replay_after_reopen(tmp_path):
+    with _journal(tmp_path, index_interval=4) as journal:
+        _fill(journal, 50)
+    with _journal(tmp_path, index_interval=4) as journal:
+        assert journal.next_offset == 50
+        assert [offset for offset, _, _ in journal.replay(37)] == list(range(37, 50))
+        assert journal.append("article.saved", {"id": 50}) == 50
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    with _journal(tmp_path) as journal:
+        _fill(journal, 10)
+    path = _segments(tmp_path)[-1]
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        # a crash halfway through the last record
+        f.truncate(size - 3)
+    with _journal(tmp_path) as journal:
+        assert journal.committed_offset == 8
+        assert [offset for offset, _, _ in journal.replay()] == list(range(9))
+        assert journal.append("article.saved", {"id": 9}) == 9
+        journal.sync()
+        assert [event["id"] for _, _, event in journal.replay(8)] == [8, 9]
+
+
+def test_corrupt_tail_is_truncated(tmp_path):
+    with _journal(tmp_path) as journal:
+        _fill(journal, 5)
+    path = _segments(tmp_path)[-1]
+    with open(path, "r+b") as f:
+        f.seek(os.path.getsize(path) - 1)
+        f.write(b"\xff")
+    with _journal(tmp_path) as journal:
+        assert [offset for offset, _, _ in journal.replay()] == list(range(4))
+
+
+def test_lost_index_is_rebuilt(tmp_path):
+    with _journal(tmp_path, segment_bytes=2048, index_interval=4) as journal:
+        _fill(journal, 200)
+    assert len(_segments(tmp_path)) > 2
+    for path in glob.glob(os.path.join(str(tmp_path), "*.idx")):
+        os.remove(path)
+    with _journal(tmp_path, segment_bytes=2048, index_interval=4) as journal:
+        assert [offset for offset, _, _ in journal.replay(123)] == list(range(123, 200))
+        assert [offset for offset, _, _ in journal.replay()] == list(range(200))
+
+
+def test_replay_filters_by_pattern(tmp_path):
+    with _journal(tmp_path) as journal:
+        journal.append("article.saved", 1)
+        journal.append("image.rendered", 2)
+        journal.append("article.polished", 3)
+        journal.sync()
+        assert [event for _, _, event in journal.replay(topic="article.*")] == [1, 3]
+
+
+def test_compaction_keeps_latest_per_key_and_offsets(tmp_path):
+    with _journal(tmp_path, segment_bytes=1024) as journal:
+        _fill(journal, 100, key=lambda i: i % 5)
+        before = {offset: event for offset, _, event in journal.replay()}
+        dropped = journal.compact(lambda topic, event: event["id"])
+        after = list(journal.replay())
+        assert dropped > 0
+        assert len(after) == 100 - dropped
+        # surviving records keep their offsets and contents
+        for offset, _, event in after:
+            assert before[offset] == event
+        # the newest record of every key survives
+        for key in range(5):
+            newest = max(offset for offset, event in before.items() if event["id"] == key)
+            assert newest in {offset for offset, _, _ in after}
+        # seeking into a compacted segment still works
+        start = after[len(after) // 2][0]
+        assert [offset for offset, _, _ in journal.replay(start)] == [offset for offset, _, _ in after
+                                                                       if offset >= start]
+        assert journal.append("article.saved", {"id": 0}) == 100
+
+
+def test_compaction_survives_reopen(tmp_path):
+    with _journal(tmp_path, segment_bytes=1024) as journal:
+        _fill(journal, 60, key=lambda i: i % 3)
+        journal.compact(lambda topic, event: event["id"])
+        expected = [offset for offset, _, _ in journal.replay()]
+    with _journal(tmp_path, segment_bytes=1024) as journal:
+        assert [offset for offset, _, _ in journal.replay()] == expected
+        assert journal.next_offset == 60
+
+
+def test_retention_respects_checkpoints(tmp_path):
+    with _journal(tmp_path, segment_bytes=1024, checkpoint_interval=1) as journal:
+        _fill(journal, 200)
+        segments = len(_segments(tmp_path))
+        assert segments > 3
+        journal.ack("indexer", 10)
+        # the first segment still holds events the indexer has not seen
+        assert journal.retain(max_segments=1) == 0
+        assert len(_segments(tmp_path)) == segments
+        journal.ack("indexer", 199)
+        removed = journal.retain(max_segments=1)
+        assert removed == segments - 1
+        assert len(_segments(tmp_path)) == 1
+        remaining = [offset for offset, _, _ in journal.replay()]
+        assert remaining and remaining[-1] == 199
+
+
+def test_retention_ignoring_checkpoints(tmp_path):
+    with _journal(tmp_path, segment_bytes=1024) as journal:
+        _fill(journal, 200)
+        journal.ack("indexer", 0)
+        assert journal.retain(max_segments=2, keep_unacknowledged=False) > 0
+        assert len(_segments(tmp_path)) == 2
+        assert [offset for offset, _, _ in journal.replay()][-1] == 199
+
+
+def test_resume_continues_after_checkpoint(tmp_path):
+    with _journal(tmp_path, checkpoint_interval=1) as journal:
+        _fill(journal, 10)
+        seen = []
+        assert journal.resume("search", "article.*", seen.append) == 10
+        assert journal.checkpoint("search") == 9
+    with _journal(tmp_path) as journal:
+        _fill(journal, 3)
+        seen = []
+        assert journal.resume("search", "article.*", seen.append) == 3
+        assert [event["n"] for event in seen] == [0, 1, 2]
+
+
+def test_checkpoint_waits_for_slower_earlier_events(tmp_path):
+    with _journal(tmp_path) as journal:
+        bus = EventBus()
+        bus.attach_journal(journal)
+        release = {}
+
+        async def handle(event):
+            release[event] = asyncio.Event()
+            await release[event].wait()
+
+        bus.subscribe("article.*", journal.durable("search", handle))
+
+        async def main():
+            bus.publish("article.saved", 0)
+            bus.publish("article.saved", 1)
+            await asyncio.sleep(0)
+            # the fast offset 1 is done while offset 0 is still running
+            release[1].set()
+            await asyncio.sleep(0)
+            assert journal.checkpoint("search") == -1
+            release[0].set()
+            await bus.drain()
+
+        asyncio.run(main())
+        assert journal.checkpoint("search") == 1
+
+
+def test_failed_event_does_not_hold_the_checkpoint(tmp_path):
+    with _journal(tmp_path) as journal:
+        bus = EventBus()
+        bus.attach_journal(journal)
+
+        def handle(event):
+            if event == 1:
+                raise RuntimeError("boom")
+
+        bus.subscribe("article.*", journal.durable("search", handle))
+        bus.publish("article.saved", 0)
+        with pytest.raises(RuntimeError):
+            bus.publish("article.saved", 1)
+        assert journal.checkpoint("search") == 0
+        bus.publish("article.saved", 2)
+        assert journal.checkpoint("search") == 2
+
+
+def test_durable_subscriber_refuses_keyed_workers(tmp_path):
+    with _journal(tmp_path) as journal:
+        bus = EventBus()
+        callback = journal.durable("search", lambda event: None)
+        with pytest.raises(ValueError):
+            bus.subscribe("article.*", callback, queued=True, workers=2, key=lambda event: event)
+        bus.subscribe("article.*", callback, queued=True, workers=2)
+
+
+def test_closed_journal_rejects_appends(tmp_path):
+    journal = _journal(tmp_path)
+    journal.close()
+    with pytest.raises(RuntimeError):
+        journal.append("article.saved", 1)
@@ -0,0 +1,131 @@
+import logging
+import os
+import time
+
+import pytest
+
+from argo.utils.logger import (BoundedQueueHandler, LazyRotatingFileHandler, RateLimitFilter, SamplingFilter,
+                               get_limited_logger)
+
+
+class _Collect(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def make_logger(request):
+    created = []
+
+    def make(*targets, maxsize=100):
+        handler = BoundedQueueHandler(list(targets), maxsize=maxsize)
+        log = logging.getLogger(f"argo.test.{request.node.name}.{len(created)}")
+        log.propagate = False
+        log.setLevel(logging.INFO)
+        log.addHandler(handler)
+        created.append((log, handler))
+        return log, handler
+
+    yield make
+    for log, handler in created:
+        log.removeHandler(handler)
+        handler.close()
+
+
+def test_records_reach_the_targets_on_flush(make_logger):
+    target = _Collect()
+    log, handler = make_logger(target)
+    for n in range(5):
+        log.info("event %d", n)
+    handler.flush()
+    assert target.messages == [f"event {n}" for n in range(5)]
+
+
+def test_full_queue_drops_and_counts(make_logger):
+    target = _Collect()
+    log, handler = make_logger(target, maxsize=1)
+    # keep the listener from draining while the queue fills up
+    handler.start()
+    handler._listener.stop()
+    for n in range(5):
+        log.info("event %d", n)
+    assert handler.dropped == 4
+
+
+def test_file_handler_is_lazy(tmp_path, make_logger):
+    log_dir = str(tmp_path / "logs")
+    target = LazyRotatingFileHandler(log_dir)
+    target.setFormatter(logging.Formatter("%(message)s"))
+    log, handler = make_logger(target)
+    assert not os.path.exists(log_dir)
+    log.info("hello")
+    handler.flush()
+    files = os.listdir(log_dir)
+    assert len(files) == 1
+    with open(os.path.join(log_dir, files[0]), encoding="utf-8") as f:
+        assert f.read() == "hello\n"
+
+
+def test_unopenable_log_file_falls_back_to_the_console(tmp_path, make_logger, capsys):
+    blocker = tmp_path / "logs"
+    blocker.write_text("not a directory")
+    console = _Collect()
+    log, handler = make_logger(console, LazyRotatingFileHandler(str(blocker)))
+    for n in range(3):
+        log.info("event %d", n)
+    handler.flush()
+    assert console.messages == ["event 0", "event 1", "event 2"]
+    assert handler._listener.alive
+    # reported once, not per record
+    assert capsys.readouterr().err.count("Logging error") == 1
+
+
+@pytest.mark.filterwarnings("ignore::pytest.PytestUnhandledThreadExceptionWarning")
+def test_stop_does_not_hang_on_a_dead_listener(make_logger):
+    class Fatal(logging.Handler):
+        def handle(self, record):
+            # not an Exception, so it ends the listener thread
+            raise SystemExit
+
+    log, handler = make_logger(Fatal(), maxsize=2)
+    for _ in range(10):
+        log.info("event")
+    time.sleep(0.1)
+    start = time.monotonic()
+    handler.flush(timeout=1)
+    handler.stop()
+    assert time.monotonic() - start < 2
+
+
+def test_rate_limit_reports_suppressed_records():
+    limit = RateLimitFilter(rate=2, per=60)
+    records = [logging.LogRecord("x", logging.INFO, __file__, 1, "tick", (), None) for _ in range(5)]
+    assert [limit.filter(record) for record in records] == [True, True, False, False, False]
+    limit._buckets[("x", "tick")][0] = 1.0
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "tick", (), None)
+    assert limit.filter(record)
+    assert record.msg == "tick (suppressed 3 similar)"
+
+
+def test_sampling():
+    sample = SamplingFilter(3)
+    record = logging.LogRecord("x", logging.INFO, __file__, 1, "tick", (), None)
+    assert [sample.filter(record) for _ in range(7)] == [True, False, False, True, False, False, True]
+    with pytest.raises(ValueError):
+        SamplingFilter(0)
+
+
+def test_limited_logger_is_a_child_with_filters(make_logger):
+    target = _Collect()
+    parent, handler = make_logger(target)
+    child = get_limited_logger("hot", sample_every=2, parent=parent)
+    assert child.parent is parent
+    assert get_limited_logger("hot", sample_every=2, parent=parent).filters == child.filters
+    for n in range(4):
+        child.info("event %d", n)
+    handler.flush()
+    assert target.messages == ["event 0", "event 2"]
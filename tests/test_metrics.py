@@ -0,0 +1,151 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.eventdriver.metrics import OTHER_TOPICS, JsonLinesExporter, LatencyHistogram, SpanHook
+
+
+class _Spans(SpanHook):
+    def __init__(self):
+        self.spans = []
+
+    def on_end(self, span):
+        self.spans.append(span)
+
+
+def test_histogram_exact_for_small_values():
+    histogram = LatencyHistogram(precision=5)
+    for value in range(1, 65):
+        histogram.record(value)
+    assert histogram.percentile(50) == 32
+    assert histogram.percentile(100) == 64
+    assert histogram.min == 1 and histogram.max == 64
+
+
+def test_histogram_relative_error_is_bounded():
+    histogram = LatencyHistogram(precision=5)
+    values = sorted(random.Random(1).randrange(1, 10 ** 9) for _ in range(10000))
+    for value in values:
+        histogram.record(value)
+    for q in (50, 90, 99, 99.9):
+        exact = values[int(round(q / 100 * len(values))) - 1]
+        reported = histogram.percentile(q)
+        # never under-reports, and over-reports by at most 2**-precision
+        assert exact <= reported <= exact * (1 + 2 ** -5)
+
+
+def test_histogram_clamps_and_snapshots():
+    histogram = LatencyHistogram(max_ns=1000)
+    histogram.record(-5)
+    histogram.record(10 ** 9)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 2
+    assert snapshot["min_ns"] == 0
+    assert snapshot["max_ns"] == 1000
+    assert LatencyHistogram().snapshot()["p99_ns"] == 0
+
+
+def test_bus_counts_publishes_calls_and_errors():
+    bus = EventBus()
+    metrics = bus.enable_metrics()
+
+    def failing(event):
+        if event == 1:
+            raise RuntimeError("boom")
+
+    bus.subscribe("article.*", failing)
+    bus.publish("article.saved", 0)
+    with pytest.raises(RuntimeError):
+        bus.publish("article.saved", 1)
+    bus.publish_many("article.polished", [0, 2])
+    snapshot = metrics.snapshot()
+    assert snapshot["topics"]["article.saved"]["published"] == 2
+    assert snapshot["topics"]["article.polished"]["published"] == 2
+    [subscriber] = snapshot["subscribers"]
+    assert subscriber["topic"] == "article.*"
+    assert subscriber["calls"] == 4
+    assert subscriber["errors"] == 1
+    assert subscriber["latency"]["count"] == 4
+
+
+def test_topic_cardinality_is_capped():
+    bus = EventBus()
+    metrics = bus.enable_metrics(max_topics=2)
+    for n in range(5):
+        bus.publish(f"t.{n}", n)
+    topics = metrics.snapshot()["topics"]
+    assert set(topics) == {"t.0", "t.1", OTHER_TOPICS}
+    assert topics[OTHER_TOPICS]["published"] == 3
+
+
+def test_disable_metrics_unwraps_subscribers():
+    bus = EventBus()
+    seen = []
+    subscription = bus.subscribe("article.*", seen.append)
+    bus.enable_metrics()
+    assert subscription.handler is not subscription.callback
+    bus.disable_metrics()
+    assert subscription.handler is subscription.callback
+    bus.publish("article.saved", 1)
+    assert seen == [1] and bus.metrics is None
+
+
+def test_spans_follow_a_chain_of_events():
+    bus = EventBus()
+    hook = _Spans()
+    bus.enable_metrics().add_span_hook(hook)
+    bus.subscribe("article.*", lambda event: bus.publish("image.render", event))
+
+    async def render(event):
+        await asyncio.sleep(0)
+
+    bus.subscribe("image.*", render)
+
+    async def main():
+        bus.publish("article.saved", 1)
+        await bus.drain()
+
+    asyncio.run(main())
+    first, second = sorted(hook.spans, key=lambda span: span.span_id)
+    assert (first.topic, first.parent_id) == ("article.saved", None)
+    # spans name the published topic, not the subscriber's pattern
+    assert (second.topic, second.parent_id) == ("image.render", first.span_id)
+    assert second.trace_id == first.trace_id
+
+
+def test_queued_workers_do_not_keep_an_old_trace():
+    bus = EventBus()
+    hook = _Spans()
+    bus.enable_metrics().add_span_hook(hook)
+    bus.subscribe("a", lambda event: bus.publish("b", event))
+    bus.subscribe("b", lambda event: None, queued=True)
+
+    async def main():
+        bus.publish("a", 1)
+        await bus.drain()
+        bus.publish("b", 2)
+        await bus.drain()
+
+    asyncio.run(main())
+    queued = [span for span in hook.spans if span.topic == "b"]
+    assert len(queued) == 2
+    chained, separate = sorted(queued, key=lambda span: span.span_id)
+    assert chained.parent_id is not None
+    assert separate.parent_id is None
+    assert separate.trace_id != chained.trace_id
+
+
+def test_json_lines_export(tmp_path):
+    bus = EventBus()
+    metrics = bus.enable_metrics()
+    path = tmp_path / "metrics.jsonl"
+    metrics.add_exporter(JsonLinesExporter(str(path)))
+    bus.publish("article.saved", 1)
+    metrics.export()
+    metrics.export()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["topics"]["article.saved"]["published"] == 1
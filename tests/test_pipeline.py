@@ -0,0 +1,172 @@
+import asyncio
+import os
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.pipeline.artifact_cache import ArtifactCache
+from argo.core.pipeline.engine import Pipeline, Step, StepStatus
+from argo.core.pipeline.writing import article_paths, writing_pipeline
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+class _Article:
+    def __init__(self, root):
+        self.draft = str(root / "post.md")
+        self.paths = article_paths(self.draft)
+        self.calls = []
+        _write(self.draft, "draft")
+        for name in ("cover", "step1"):
+            self.add_prompt(name)
+
+    def add_prompt(self, name):
+        _write(os.path.join(os.path.dirname(self.draft), "xhs-images", "prompts", f"{name}.md"), name)
+
+    def polish(self, draft, polished):
+        self.calls.append("polish")
+        _write(polished, _read(draft).upper())
+
+    async def render_image(self, prompt, png):
+        self.calls.append(f"image:{os.path.splitext(os.path.basename(png))[0]}")
+        _write(png, _read(prompt))
+
+    def assemble(self, polished, images, final):
+        self.calls.append("final")
+        _write(final, _read(polished) + "".join(f"\n{name}" for name in sorted(images)))
+
+    def run(self, bus=None):
+        self.calls.clear()
+        pipeline = writing_pipeline(self.draft, self.polish, self.render_image, self.assemble, bus=bus or EventBus())
+        return asyncio.run(pipeline.run())
+
+
+def test_first_run_completes_every_step(tmp_path):
+    article = _Article(tmp_path)
+    statuses = article.run()
+    assert set(statuses.values()) == {StepStatus.COMPLETED}
+    assert sorted(article.calls) == ["final", "image:cover", "image:step1", "polish"]
+    assert _read(article.paths["final"]) == "DRAFT\ncover\nstep1"
+
+
+def test_rerun_is_served_from_the_cache(tmp_path):
+    article = _Article(tmp_path)
+    article.run()
+    statuses = article.run()
+    assert set(statuses.values()) == {StepStatus.CACHED}
+    assert article.calls == []
+
+
+def test_new_prompt_runs_only_its_image_and_final(tmp_path):
+    article = _Article(tmp_path)
+    article.run()
+    article.add_prompt("step2")
+    statuses = article.run()
+    assert sorted(article.calls) == ["final", "image:step2"]
+    assert statuses["polish"] is StepStatus.CACHED
+    assert statuses["image:cover"] is StepStatus.CACHED
+    assert _read(article.paths["final"]) == "DRAFT\ncover\nstep1\nstep2"
+
+
+def test_missing_output_is_restored(tmp_path):
+    article = _Article(tmp_path)
+    article.run()
+    os.remove(article.paths["polished"])
+    statuses = article.run()
+    assert article.calls == []
+    assert statuses["polish"] is StepStatus.CACHED
+    assert _read(article.paths["polished"]) == "DRAFT"
+
+
+def test_hand_edited_output_is_kept(tmp_path):
+    article = _Article(tmp_path)
+    article.run()
+    _write(article.paths["polished"], "EDITED")
+    statuses = article.run()
+    assert statuses["polish"] is StepStatus.CACHED
+    assert _read(article.paths["polished"]) == "EDITED"
+    # the edit is a changed input of final
+    assert article.calls == ["final"]
+    assert _read(article.paths["final"]).startswith("EDITED")
+
+
+def test_dependents_are_skipped_after_a_failure(tmp_path):
+    bus = EventBus()
+    pipeline = Pipeline("p", str(tmp_path), bus=bus)
+
+    def fail(step):
+        raise RuntimeError("boom")
+
+    ran = []
+    pipeline.add(Step("a", fail))
+    pipeline.add(Step("b", lambda step: ran.append("b"), after=["a"]))
+    pipeline.add(Step("c", lambda step: ran.append("c"), after=["b"]))
+    pipeline.add(Step("d", lambda step: ran.append("d")))
+    skipped = []
+    bus.subscribe("pipeline.step.skipped", lambda event: skipped.append(event.step))
+    statuses = asyncio.run(pipeline.run())
+    assert statuses == {"a": StepStatus.FAILED, "b": StepStatus.SKIPPED, "c": StepStatus.SKIPPED,
+                        "d": StepStatus.COMPLETED}
+    assert ran == ["d"]
+    assert skipped == ["b", "c"]
+
+
+def test_concurrent_runs_on_one_bus_stay_apart(tmp_path):
+    bus = EventBus()
+    first = Pipeline("p", str(tmp_path / "one"), bus=bus)
+    second = Pipeline("p", str(tmp_path / "two"), bus=bus)
+    order = []
+
+    async def slow(step):
+        await asyncio.sleep(0.05)
+        order.append("slow")
+
+    first.add(Step("a", slow))
+    first.add(Step("b", lambda step: order.append("first.b"), after=["a"]))
+    # same step names: only the run id tells the two runs' events apart
+    second.add(Step("a", lambda step: order.append("second.a")))
+    second.add(Step("b", lambda step: order.append("second.b"), after=["a"]))
+
+    async def main():
+        return await asyncio.gather(first.run(), second.run())
+
+    results = asyncio.run(main())
+    assert order.index("first.b") > order.index("slow")
+    assert all(set(statuses.values()) == {StepStatus.COMPLETED} for statuses in results)
+
+
+def test_failing_observer_does_not_stall_the_run(tmp_path):
+    bus = EventBus()
+
+    def observer(event):
+        raise RuntimeError("observer")
+
+    bus.subscribe("pipeline.#", observer)
+    pipeline = Pipeline("p", str(tmp_path), bus=bus)
+    pipeline.add(Step("a", lambda step: None))
+    pipeline.add(Step("b", lambda step: None, after=["a"]))
+    statuses = asyncio.run(asyncio.wait_for(pipeline.run(), 5))
+    assert statuses == {"a": StepStatus.COMPLETED, "b": StepStatus.COMPLETED}
+
+
+def test_cache_restore_reports_lost_objects(tmp_path):
+    cache = ArtifactCache(str(tmp_path))
+    output = str(tmp_path / "out.txt")
+    _write(output, "v1")
+    recorded = cache.store(cache.key("s", []), [output])
+    _write(output, "v2")
+    assert cache.edited(recorded) == [output]
+    os.remove(output)
+    assert cache.restore(recorded) and _read(output) == "v1"
+    os.remove(output)
+    for directory, _, files in os.walk(os.path.join(cache.cache_dir, "objects")):
+        for name in files:
+            os.remove(os.path.join(directory, name))
+    assert not cache.restore(recorded)
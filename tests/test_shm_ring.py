@@ -0,0 +1,48 @@
+import pytest
+
+from argo.core.eventdriver.shm_ring import ShmOverrunError, ShmReader, ShmRing
+
+
+@pytest.fixture
+def ring():
+    ring = ShmRing(1024)
+    yield ring
+    ring.close()
+
+
+@pytest.fixture
+def reader():
+    reader = ShmReader()
+    yield reader
+    reader.close()
+
+
+def test_put_and_get(ring, reader):
+    refs = [ring.put(bytes([i]) * 100) for i in range(5)]
+    for i, ref in enumerate(refs):
+        assert reader.get(ref) == bytes([i]) * 100
+
+
+def test_blobs_are_not_split_across_the_end(ring, reader):
+    ring.put(b"a" * 1000)
+    name, position, length = ring.put(b"b" * 100)
+    assert position == 1024
+    assert reader.get((name, position, length)) == b"b" * 100
+
+
+def test_overwritten_blob_raises(ring, reader):
+    first = ring.put(b"a" * 600)
+    ring.put(b"b" * 600)
+    with pytest.raises(ShmOverrunError):
+        reader.get(first)
+
+
+def test_blob_survives_until_its_space_is_reused(ring, reader):
+    first = ring.put(b"a" * 400)
+    ring.put(b"b" * 400)
+    assert reader.get(first) == b"a" * 400
+
+
+def test_oversized_payload_is_rejected(ring):
+    with pytest.raises(ValueError):
+        ring.put(b"x" * 1025)
@@ -0,0 +1,68 @@
+import pytest
+
+from argo.core.eventdriver.topic_trie import TopicTrie
+
+
+def _matches(trie, topic):
+    return sorted(trie.match(topic))
+
+
+@pytest.mark.parametrize("pattern, topic, matches", [
+    ("a.b.c", "a.b.c", True),
+    ("a.b.c", "a.b", False),
+    ("a.*.c", "a.b.c", True),
+    ("a.*.c", "a.c", False),
+    ("a.*", "a.b.c", False),
+    ("*", "a", True),
+    ("*", "a.b", False),
+    ("a.#", "a", True),
+    ("a.#", "a.b.c", True),
+    ("#", "a.b", True),
+    ("a.#.c", "a.c", True),
+    ("a.#.c", "a.b.x.c", True),
+    ("a.#.c", "a.b.x", False),
+    ("#.c", "a.b.c", True),
+    ("*.#", "a", True),
+    ("*.#", "a.b.c", True),
+])
+def test_wildcards(pattern, topic, matches):
+    trie = TopicTrie()
+    trie.add(pattern, "entry")
+    assert _matches(trie, topic) == (["entry"] if matches else [])
+
+
+def test_entry_matched_by_several_paths_is_yielded_once():
+    trie = TopicTrie()
+    trie.add("a.#.#", "entry")
+    assert _matches(trie, "a.b.c") == ["entry"]
+
+
+def test_entries_of_several_patterns():
+    trie = TopicTrie()
+    trie.add("pipeline.step.*", 1)
+    trie.add("pipeline.#", 2)
+    trie.add("pipeline.step.done", 3)
+    trie.add("pipeline.run.*", 4)
+    assert _matches(trie, "pipeline.step.done") == [1, 2, 3]
+    assert len(trie) == 4
+
+
+def test_remove_prunes_empty_nodes():
+    trie = TopicTrie()
+    trie.add("a.b.c", 1)
+    trie.add("a.b.c", 1)
+    assert len(trie) == 1
+    assert trie.remove("a.b.c", 1) is True
+    assert trie.remove("a.b.c", 1) is False
+    assert trie.remove("x.y", 1) is False
+    assert len(trie) == 0
+    assert trie._root.children == {}
+    assert _matches(trie, "a.b.c") == []
+
+
+def test_remove_keeps_siblings():
+    trie = TopicTrie()
+    trie.add("a.b", 1)
+    trie.add("a.b.c", 2)
+    trie.remove("a.b.c", 2)
+    assert _matches(trie, "a.b") == [1]
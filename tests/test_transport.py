@@ -0,0 +1,133 @@
+import os
+import socket
+import time
+
+import pytest
+
+from argo.core.eventdriver.event_publisher import EventBus
+from argo.core.eventdriver.transport import SUBSCRIBE, Broker, UnixSocketTransport, _frame
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = os.path.join(str(tmp_path), "events.sock")
+    broker = Broker(path)
+    thread = broker.start()
+    yield path
+    broker.stop()
+    thread.join(5)
+
+
+@pytest.fixture
+def buses(path):
+    buses = []
+
+    def connect(**kwargs):
+        bus = EventBus()
+        bus.attach_transport(UnixSocketTransport(path, **kwargs))
+        buses.append(bus)
+        return bus
+
+    yield connect
+    for bus in buses:
+        bus.detach_transport().close()
+
+
+def _settle():
+    # subscriptions travel to the broker asynchronously
+    time.sleep(0.1)
+
+
+def test_broadcast_reaches_every_other_process(buses):
+    publisher, first, second = buses(), buses(), buses()
+    seen = {name: [] for name in ("publisher", "first", "second")}
+    publisher.subscribe("article.*", seen["publisher"].append)
+    first.subscribe("article.*", seen["first"].append)
+    second.subscribe("article.#", seen["second"].append)
+    first.subscribe("image.*", seen["first"].append)
+    _settle()
+    publisher.publish("article.saved", {"id": 1})
+    _wait_for(lambda: seen["first"] and seen["second"])
+    _settle()
+    assert seen == {"publisher": [{"id": 1}], "first": [{"id": 1}], "second": [{"id": 1}]}
+
+
+def test_large_payloads_go_through_shared_memory(buses):
+    publisher, subscriber = buses(shm_threshold=1024), buses()
+    seen = []
+    subscriber.subscribe("image.rendered", seen.append)
+    _settle()
+    blob = os.urandom(256 * 1024)
+    publisher.publish("image.rendered", blob)
+    _wait_for(lambda: seen)
+    assert seen == [blob]
+
+
+def test_group_members_split_the_events(buses):
+    publisher = buses()
+    workers = [buses() for _ in range(3)]
+    seen = [[] for _ in workers]
+    broadcast = []
+    for bus, received in zip(workers, seen):
+        bus.subscribe("job.*", received.append, group="renderers")
+    workers[0].subscribe("job.*", broadcast.append)
+    _settle()
+    for n in range(30):
+        publisher.publish("job.run", n)
+    _wait_for(lambda: sum(map(len, seen)) == 30 and len(broadcast) == 30)
+    _settle()
+    assert sorted(n for received in seen for n in received) == list(range(30))
+    assert all(len(received) == 10 for received in seen)
+
+
+def test_publisher_can_be_picked_for_its_own_group(buses):
+    first, second = buses(), buses()
+    seen = [[], []]
+    first.subscribe("job.*", seen[0].append, group="renderers")
+    second.subscribe("job.*", seen[1].append, group="renderers")
+    _settle()
+    for n in range(10):
+        first.publish("job.run", n)
+    _wait_for(lambda: len(seen[0]) + len(seen[1]) == 10)
+    _settle()
+    assert sorted(seen[0] + seen[1]) == list(range(10))
+    assert seen[0] and seen[1]
+
+
+def test_unsubscribe_stops_remote_delivery(buses):
+    publisher, subscriber = buses(), buses()
+    seen = []
+    subscription = subscriber.subscribe("article.*", seen.append)
+    _settle()
+    publisher.publish("article.saved", 1)
+    _wait_for(lambda: seen)
+    subscription.unsubscribe()
+    _settle()
+    publisher.publish("article.saved", 2)
+    _settle()
+    assert seen == [1]
+
+
+def test_malformed_frame_drops_only_its_sender(path, buses):
+    publisher, subscriber = buses(), buses()
+    seen = []
+    subscriber.subscribe("article.*", seen.append)
+    rogue = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    rogue.connect(path)
+    # a group that is not valid utf-8
+    rogue.sendall(_frame(SUBSCRIBE, b"\x02\x00\xff\xfe" + b"article.*"))
+    rogue.settimeout(5)
+    assert rogue.recv(64) == b""
+    rogue.close()
+    _settle()
+    publisher.publish("article.saved", 1)
+    _wait_for(lambda: seen)
+    assert seen == [1]